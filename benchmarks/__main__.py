@@ -0,0 +1,76 @@
+"""Run janeiro benchmark suites and print their results as JSON.
+
+Usage: python -m benchmarks [--suite NAME] [--repeat N] [--output PATH]
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from importlib import metadata
+
+from benchmarks import framework, middleware, uuid_keys
+
+SUITES = {
+    **{
+        name: lambda args, benchmark=benchmark: benchmark(args.repeat)
+        for name, benchmark in framework.BENCHMARKS.items()
+    },
+    "middleware": lambda args: asyncio.run(middleware.run(20_000, 10)),
+    "uuid_keys": lambda args: uuid_keys.run(200_000, 1000),
+}
+
+PACKAGES = ("janeiro", "fastapi", "starlette", "pydantic", "sqlalchemy")
+
+
+def get_package_version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def get_environment() -> dict:
+    """Describe where results come from, to only compare comparable runs."""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "packages": {package: get_package_version(package) for package in PACKAGES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=list(SUITES),
+        help="Suite to run, may be repeated. Defaults to every suite.",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.suite or SUITES:
+        print("Running %s..." % name, file=sys.stderr)
+        start = time.perf_counter()
+        results[name] = SUITES[name](args)
+        print("Done in %.1fs" % (time.perf_counter() - start), file=sys.stderr)
+
+    report = json.dumps(
+        {"environment": get_environment(), "results": results}, indent=2
+    )
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(report)
+
+
+if __name__ == "__main__":
+    main()
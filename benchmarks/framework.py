@@ -0,0 +1,307 @@
+"""Measure janeiro hot paths: app build, configuration, logging, requests and entities.
+
+Usage: python -m benchmarks.framework [--repeat N] [--only NAME]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import timeit
+
+from fastapi import APIRouter, FastAPI
+from sqlalchemy import Column, String, create_engine
+
+from janeiro import Application
+from janeiro.api import ApiRegistry
+from janeiro.benchmark import AsgiClient
+from janeiro.config import ConfigOption, Configuration
+from janeiro.config.loaders.environment import EnvironmentConfigLoader
+from janeiro.config.loaders.test import TestConfigLoader
+from janeiro.plugins import Plugin
+from janeiro.plugins.database.entity import ResourceEntity
+from janeiro.plugins.database.session import bind_engines, session, unit_of_work
+from janeiro.plugins.logging import (
+    REQUEST_ID_CTX,
+    LoggingMiddleware,
+    old_factory,
+    record_factory,
+)
+
+BUILD_SIZES = (1, 10, 100)
+ROUTES_PER_ROUTER = 10
+
+
+def summarize(durations: list, number: int, unit: float = 1e6) -> dict:
+    """Median and best duration of one operation, in microseconds by default."""
+    per_operation = sorted(duration / number * unit for duration in durations)
+    return {
+        "median": round(statistics.median(per_operation), 3),
+        "min": round(per_operation[0], 3),
+        "repeat": len(durations),
+        "number": number,
+    }
+
+
+def measure(function, repeat: int, number: int) -> dict:
+    return summarize(timeit.Timer(function).repeat(repeat, number), number)
+
+
+def measure_async(loop, function, repeat: int, number: int) -> dict:
+    async def batch():
+        for _ in range(number):
+            await function()
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loop.run_until_complete(batch())
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, number)
+
+
+class RoutePlugin(Plugin):
+    __plugin__ = "benchmark"
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def endpoint(self, limit: int = 10):
+        return {"index": self.index, "limit": limit}
+
+    def command(self):
+        pass
+
+    def extend_api(self, api):
+        api.add_api_route("/plugins/%s" % self.index, self.endpoint)
+
+    def extend_cli(self, cli):
+        cli.declare_group("benchmark", description="Benchmark commands")
+        cli.add_command(
+            self.command, name="command-%s" % self.index, help="", group="benchmark"
+        )
+
+
+def make_router(index: int) -> APIRouter:
+    router = APIRouter(prefix="/routers/%s" % index)
+    for route_index in range(ROUTES_PER_ROUTER):
+
+        def endpoint(item_id: int, limit: int = 10):
+            return {"item_id": item_id, "limit": limit}
+
+        router.add_api_route("/%s/{item_id}" % route_index, endpoint)
+    return router
+
+
+def make_application(plugins: int, routers: int) -> Application:
+    app = Application(
+        config=Configuration(app_name="benchmark", loader=TestConfigLoader({})),
+        api_title="benchmark",
+        api_version="0.0.0",
+    )
+    for index in range(plugins):
+        app.use_plugin(RoutePlugin(index))
+    for index in range(routers):
+        app.include_router(make_router(index))
+    return app
+
+
+def measure_build(build: str, plugins: int, routers: int, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        app = make_application(plugins, routers)
+        start = time.perf_counter()
+        getattr(app, build)()
+        durations.append(time.perf_counter() - start)
+    # builds are measured in milliseconds
+    return summarize(durations, 1, unit=1e3)
+
+
+def bench_build(repeat: int) -> dict:
+    """Milliseconds to build api and cli, by number of plugins and routers."""
+    results = {}
+    for build in ("build_api", "build_cli"):
+        for size in BUILD_SIZES:
+            results["%s.plugins_%s" % (build, size)] = measure_build(
+                build, size, 0, repeat
+            )
+            if build == "build_api":
+                results["%s.routers_%s" % (build, size)] = measure_build(
+                    build, 0, size, repeat
+                )
+    return results
+
+
+def bench_config(repeat: int) -> dict:
+    """Microseconds per Configuration.get, served from cache or loaded."""
+    option = ConfigOption(key="benchmark.value", type=int, default=None)
+    os.environ["BENCHMARK_BENCHMARK_VALUE"] = "42"
+    config = Configuration(
+        app_name="benchmark", loader=EnvironmentConfigLoader(prefix="benchmark")
+    )
+    config.get(option)
+
+    def get_missing():
+        config.cache.clear()
+        config.get(option)
+
+    return {
+        "get.cache_hit": measure(lambda: config.get(option), repeat, 100_000),
+        "get.cache_miss": measure(get_missing, repeat, 10_000),
+    }
+
+
+def bench_record_factory(repeat: int) -> dict:
+    """Microseconds to create a log record, with or without janeiro factory."""
+    args = ("benchmark", logging.INFO, __file__, 1, "message %s", ("value",), None)
+    results = {
+        "logging_factory": measure(lambda: old_factory(*args), repeat, 50_000),
+        "janeiro_factory.no_request": measure(
+            lambda: record_factory(*args), repeat, 50_000
+        ),
+    }
+    token = REQUEST_ID_CTX.set("0" * 32)
+    try:
+        results["janeiro_factory.in_request"] = measure(
+            lambda: record_factory(*args), repeat, 50_000
+        )
+    finally:
+        REQUEST_ID_CTX.reset(token)
+    return results
+
+
+def make_dependency(is_async: bool):
+    # each dependency is a distinct callable, which FastAPI solves on its own
+
+    def sync_dependency():
+        pass
+
+    async def async_dependency():
+        pass
+
+    return async_dependency if is_async else sync_dependency
+
+
+def make_request_api(is_async: bool = True, dependencies: int = 0, middleware=None):
+    registry = ApiRegistry()
+    for _ in range(dependencies):
+        registry.add_dependency(make_dependency(is_async))
+    api = FastAPI(dependencies=registry.get_dependencies())
+
+    @api.get("/ping")
+    async def ping():
+        return {"ping": "pong"}
+
+    if middleware is not None:
+        logger = logging.getLogger("benchmark.access")
+        # records are created and filtered, but never written
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(logging.NullHandler())
+        api.add_middleware(middleware, logger=logger)
+    return api
+
+
+def bench_request_overhead(repeat: int) -> dict:
+    """Microseconds per request, with logging middleware or global dependencies."""
+    variants = {
+        "bare": make_request_api(),
+        "logging_middleware": make_request_api(middleware=LoggingMiddleware),
+        "async_dependencies_1": make_request_api(True, 1),
+        "async_dependencies_10": make_request_api(True, 10),
+        # sync dependencies are run in threadpool
+        "sync_dependencies_1": make_request_api(False, 1),
+        "sync_dependencies_10": make_request_api(False, 10),
+    }
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for name, api in variants.items():
+            client = AsgiClient(api)
+            # warm up route and middleware stack before measuring
+            measure_async(loop, lambda: client.request("GET", "/ping"), 1, 100)
+            results[name] = measure_async(
+                loop, lambda: client.request("GET", "/ping"), repeat, 1000
+            )
+    finally:
+        loop.close()
+    return results
+
+
+class BenchmarkResource(ResourceEntity):
+    __tablename__ = "benchmark_resources"
+
+    name = Column(String(64))
+
+
+def bench_entity_create(repeat: int, rows: int = 1000) -> dict:
+    """Microseconds per row inserted in SQLite, by commit per row or per batch."""
+
+    def create_autocommit():
+        for index in range(rows):
+            BenchmarkResource.create({"name": "resource %s" % index})
+        session.remove()
+
+    def create_unit_of_work():
+        with unit_of_work():
+            for index in range(rows):
+                BenchmarkResource.create({"name": "resource %s" % index})
+
+    def bulk_create():
+        BenchmarkResource.bulk_create(
+            {"name": "resource %s" % index} for index in range(rows)
+        )
+        session.remove()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine("sqlite:///" + os.path.join(directory, "benchmark.db"))
+        BenchmarkResource.__table__.create(engine)
+        bind_engines(engine)
+        try:
+            return {
+                "create.commit_per_row": summarize(
+                    timeit.Timer(create_autocommit).repeat(repeat, 1), rows
+                ),
+                "create.unit_of_work": summarize(
+                    timeit.Timer(create_unit_of_work).repeat(repeat, 1), rows
+                ),
+                "bulk_create": summarize(
+                    timeit.Timer(bulk_create).repeat(repeat, 1), rows
+                ),
+            }
+        finally:
+            engine.dispose()
+
+
+BENCHMARKS = {
+    "build": bench_build,
+    "config": bench_config,
+    "record_factory": bench_record_factory,
+    "request_overhead": bench_request_overhead,
+    "entity_create": bench_entity_create,
+}
+
+
+def run(repeat: int, only: list = None) -> dict:
+    return {
+        name: benchmark(repeat)
+        for name, benchmark in BENCHMARKS.items()
+        if not only or name in only
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS))
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.repeat, args.only), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compare requests/s of a trivial route behind BaseHTTPMiddleware and pure ASGI logging.
+
+Usage: python -m benchmarks.middleware [--requests N] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from janeiro.plugins.logging import REQUEST_ID_CTX, LoggingMiddleware
+
+
+class BaseHTTPLoggingMiddleware(BaseHTTPMiddleware):
+    """Logging middleware as implemented before moving to pure ASGI."""
+
+    def __init__(self, app, logger: logging.Logger):
+        super().__init__(app)
+        self.logger = logger
+
+    async def dispatch(self, request: Request, call_next):
+        token = REQUEST_ID_CTX.set(uuid4().hex)
+        response = await call_next(request)
+        self.logger.info(
+            "%s %s  %s", request.method, request.url.path, response.status_code
+        )
+        REQUEST_ID_CTX.reset(token)
+        return response
+
+
+VARIANTS = {
+    "no_middleware": None,
+    "base_http_middleware": BaseHTTPLoggingMiddleware,
+    "pure_asgi_middleware": LoggingMiddleware,
+}
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ping": "pong"}
+
+    if middleware is not None:
+        app.add_middleware(middleware, logger=logging.getLogger("benchmark"))
+    return app
+
+
+async def request(app: FastAPI, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def run_variant(name: str, requests: int, concurrency: int) -> dict:
+    app = build_app(VARIANTS[name])
+
+    async def worker(count: int):
+        for _ in range(count):
+            await request(app, "/ping")
+
+    # warm up route and middleware stack before measuring
+    await worker(100)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    total = requests // concurrency * concurrency
+    return {
+        "requests": total,
+        "seconds": round(duration, 4),
+        "requests_per_second": round(total / duration),
+    }
+
+
+async def run(requests: int, concurrency: int) -> dict:
+    # measure middleware overhead, not log formatting and output
+    logging.disable(logging.INFO)
+    try:
+        return {
+            name: await run_variant(name, requests, concurrency) for name in VARIANTS
+        }
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests, args.concurrency))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
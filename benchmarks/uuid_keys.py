@@ -0,0 +1,75 @@
+"""Compare random hex UUID keys with time-ordered binary UUID keys on SQLite.
+
+Usage: python -m benchmarks.uuid_keys [--rows N] [--batch-size N]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert
+
+from janeiro.plugins.database.identifiers import BinaryUUID, new_uuid4, new_uuid7
+
+VARIANTS = {
+    "uuid4_hex_string": (String(32), new_uuid4),
+    "uuid7_binary": (BinaryUUID(), new_uuid7),
+}
+
+
+def run_variant(directory: str, name: str, rows: int, batch_size: int) -> dict:
+    column_type, generate_uuid = VARIANTS[name]
+    metadata = MetaData()
+    table = Table(
+        "resources",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("uuid", column_type, unique=True, index=True),
+        Column("payload", String(64)),
+    )
+    engine = create_engine("sqlite:///" + os.path.join(directory, name + ".db"))
+    metadata.create_all(engine)
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        batch = [
+            {"uuid": generate_uuid(), "payload": "x" * 64}
+            for _ in range(min(batch_size, rows - offset))
+        ]
+        with engine.begin() as connection:
+            connection.execute(insert(table), batch)
+    duration = time.perf_counter() - start
+
+    with engine.connect() as connection:
+        index_size = connection.exec_driver_sql(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'ix_resources_uuid'"
+        ).scalar()
+    engine.dispose()
+    return {
+        "rows": rows,
+        "seconds": round(duration, 4),
+        "rows_per_second": round(rows / duration),
+        "index_bytes": index_size,
+    }
+
+
+def run(rows: int, batch_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        return {
+            name: run_variant(directory, name, rows, batch_size) for name in VARIANTS
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.rows, args.batch_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
-import asyncio
 import logging
 
 from fastapi import APIRouter
 from pydantic import BaseModel
 
 from example.domain.accounts.entity import AccountEntity
+from janeiro.plugins.database.routes import add_export_route, add_list_route
 
 router = APIRouter(tags=["accounts"])
 logger = logging.getLogger(__name__)
@@ -18,4 +18,15 @@ class AccountReadDTO(BaseModel):
 
 @router.post("/accounts", response_model=AccountReadDTO)
 async def create_account():
-    return AccountEntity.create({"username": "toto", "email": "toto@example.com"})
+    return await AccountEntity.acreate(
+        {"username": "toto", "email": "toto@example.com", "password": "toto"}
+    )
+
+
+add_list_route(router, AccountEntity, AccountReadDTO, path="/accounts")
+add_export_route(
+    router,
+    AccountEntity,
+    path="/accounts/export",
+    columns=["uuid", "username", "email"],
+)
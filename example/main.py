@@ -1,4 +1,3 @@
-import example.api
 from janeiro import Application
 from janeiro.config import Configuration
 from janeiro.config.loaders.environment import EnvironmentConfigLoader
@@ -19,10 +18,15 @@ app = Application(
 )
 
 app.use_plugin(LoggingPlugin())
-app.use_plugin(DatabasePlugin(migrations_module="example.db.migrations"))
+app.use_plugin(
+    DatabasePlugin(
+        migrations_module="example.db.migrations",
+        entity_modules=["example.domain.accounts.entity"],
+    )
+)
 app.use_plugin(AuthPlugin())
 
-app.include_router(example.api.router)
+app.include_router("example.api:router")
 
 cli = app.get_cli()
 
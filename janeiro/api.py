@@ -1,12 +1,12 @@
-from typing import Any, Callable, Dict, List, Tuple, Type
+from typing import Any, Callable, Dict, List, Tuple
 
 from fastapi import APIRouter, Depends, params
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp
 
 
 class ApiRegistry:
     dependencies: List[params.Depends]
-    middlewares: List[Tuple[Type[BaseHTTPMiddleware], Dict[str, Any]]]
+    middlewares: List[Tuple[Callable[..., ASGIApp], Dict[str, Any]]]
 
     def __init__(self):
         self.router = APIRouter(tags=["extensions"])
@@ -20,7 +20,8 @@ class ApiRegistry:
     def add_dependency(self, dependency: Callable):
         self.dependencies.append(Depends(dependency))
 
-    def add_middleware(self, middleware: BaseHTTPMiddleware, **options):
+    def add_middleware(self, middleware: Callable[..., ASGIApp], **options):
+        """Register an ASGI middleware, called with the wrapped app and options."""
         self.middlewares.append((middleware, options))
 
     def get_dependencies(self):
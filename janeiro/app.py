@@ -1,16 +1,19 @@
+import inspect
 import logging
 from contextlib import asynccontextmanager
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Union
 
 import click
-from fastapi import APIRouter, FastAPI
 
-from janeiro.api import ApiRegistry
-from janeiro.cli import CliRegistry
+from janeiro.cli import CliRegistry, LazyGroup
 from janeiro.config import Configuration
+from janeiro.imports import IMPORT_TIME_CMD_OPTIONS, cmd_import_time, import_from_string
 from janeiro.plugins import Plugin
 from janeiro.plugins.defaults import ApiPlugin, HealthCheckPlugin
 
+if TYPE_CHECKING:
+    from fastapi import APIRouter, FastAPI
+
 
 def build_tags_list(tags: Dict[str, str]):
     if tags is None:
@@ -21,11 +24,11 @@ def build_tags_list(tags: Dict[str, str]):
 
 
 class Application:
-    api: FastAPI
+    api: "FastAPI"
     cli: click.Group
     config: Configuration
     plugins: List[Plugin]
-    routers: List[APIRouter]
+    routers: List[Union["APIRouter", str]]
 
     def __init__(
         self,
@@ -51,7 +54,12 @@ class Application:
         self.logger = logging.getLogger(self.config.app_name)
 
     @asynccontextmanager
-    async def _lifespan(self, api: FastAPI):
+    async def _lifespan(self, api: "FastAPI"):
+        for plugin in self.plugins:
+            result = plugin.startup()
+            if inspect.isawaitable(result):
+                await result
+
         yield
 
         for plugin in self.plugins:
@@ -80,6 +88,11 @@ class Application:
         self.plugins.append(plugin)
 
     def build_api(self):
+        # imported here so that CLI commands do not pay for it
+        from fastapi import FastAPI
+
+        from janeiro.api import ApiRegistry
+
         self.configure_plugins()
 
         api_registry = ApiRegistry()
@@ -97,23 +110,38 @@ class Application:
         self.api.include_router(api_registry.router)
 
         for router in self.routers:
+            if isinstance(router, str):
+                router = import_from_string(router)
             self.api.include_router(router)
 
     def build_cli(self):
         self.configure_plugins()
 
         cli_registry = CliRegistry()
+        cli_registry.add_command(
+            cmd_import_time,
+            name="import-time",
+            help="Report modules imported by a command, slowest first.",
+            options=IMPORT_TIME_CMD_OPTIONS,
+        )
         for plugin in self.plugins:
             plugin.extend_cli(cli_registry)
 
         self.cli = click.Group(help=cli_registry.description)
 
-        for name, commands in cli_registry.group_commands.items():
+        for name in cli_registry.get_group_names():
+            commands = cli_registry.group_commands.get(name, [])
             description = None
             if name is not None:
                 description = cli_registry.group_descriptions.get(name)
 
-            group = self.cli if name is None else click.Group(name, help=description)
+            group = self.cli
+            if name is not None:
+                group = LazyGroup(
+                    name,
+                    help=description,
+                    loaders=cli_registry.group_loaders.get(name, []),
+                )
             for command in commands:
                 group.add_command(command)
 
@@ -142,5 +170,9 @@ class Application:
 
         return self.cli
 
-    def include_router(self, router: APIRouter):
+    def include_router(self, router: Union["APIRouter", str]):
+        """Include a router, or "module:attribute" string of a router.
+
+        Routers given as strings are only imported when the API is built.
+        """
         return self.routers.append(router)
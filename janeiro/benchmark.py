@@ -0,0 +1,162 @@
+import asyncio
+import math
+import time
+from typing import Dict, List, Tuple
+
+from starlette.types import ASGIApp
+
+PERCENTILES = (50, 95, 99)
+
+
+def get_benchmark_routes(api) -> List[str]:
+    """GET routes of the OpenAPI schema which take no path parameters."""
+    return [
+        path
+        for path, operations in api.openapi()["paths"].items()
+        if "get" in operations and "{" not in path
+    ]
+
+
+def get_percentile(sorted_values: List[int], percentile: float) -> int:
+    """Nearest-rank percentile of already sorted values."""
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class AsgiClient:
+    """Drive an ASGI app in process, without network nor HTTP parsing."""
+
+    def __init__(self, app: ASGIApp, headers: List[Tuple[str, str]] = None):
+        self.app = app
+        self.headers = [(b"host", b"benchmark")] + [
+            (name.lower().encode(), value.encode()) for name, value in headers or ()
+        ]
+
+    async def request(self, method: str, path: str) -> int:
+        path, _, query_string = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            "root_path": "",
+            "headers": self.headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("127.0.0.1", 80),
+        }
+        status_code = None
+        request_sent = False
+        response_complete = asyncio.Event()
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # streaming responses listen for disconnection until they complete
+            await response_complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete.set()
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # errors are re-raised by apps once they sent a 500 response, if any
+            response_complete.set()
+            return status_code or 500
+        return status_code
+
+
+async def run_route(
+    client: AsgiClient, path: str, requests: int, concurrency: int, warmup: int
+) -> dict:
+    latencies = []
+    errors = 0
+
+    async def worker(count: int, record: bool):
+        nonlocal errors
+        for _ in range(count):
+            start = time.perf_counter_ns()
+            status_code = await client.request("GET", path)
+            if record:
+                latencies.append(time.perf_counter_ns() - start)
+                if status_code is None or status_code >= 400:
+                    errors += 1
+
+    await worker(warmup, record=False)
+    counts = [
+        requests // concurrency + (i < requests % concurrency)
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(count, record=True) for count in counts))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": round(requests / duration, 1),
+    }
+    for percentile in PERCENTILES:
+        result["p%s_ms" % percentile] = round(
+            get_percentile(latencies, percentile) / 1e6, 3
+        )
+    return result
+
+
+async def run_benchmark(
+    api,
+    paths: List[str],
+    requests: int,
+    concurrency: int,
+    warmup: int = 50,
+    headers: List[Tuple[str, str]] = None,
+) -> Dict[str, dict]:
+    """Benchmark routes one after another, with api lifespan running."""
+    client = AsgiClient(api, headers)
+    async with api.router.lifespan_context(api):
+        return {
+            path: await run_route(client, path, requests, concurrency, warmup)
+            for path in paths
+        }
+
+
+def compare_results(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Describe routes whose p95 latency or throughput regressed past tolerance."""
+    regressions = []
+    for path, result in results.items():
+        reference = baseline.get(path)
+        if reference is None:
+            continue
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                "%s: p95 went from %sms to %sms"
+                % (path, reference["p95_ms"], result["p95_ms"])
+            )
+        if result["requests_per_second"] < reference["requests_per_second"] * (
+            1 - tolerance
+        ):
+            regressions.append(
+                "%s: throughput went from %s to %s requests/s"
+                % (
+                    path,
+                    reference["requests_per_second"],
+                    result["requests_per_second"],
+                )
+            )
+    return regressions
@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import Callable, List
 
 import click
 
@@ -8,10 +8,18 @@ class CliRegistry:
         self.description = None
         self.group_descriptions = {}
         self.group_commands = {}
+        self.group_loaders = {}
 
-    def declare_group(self, group: str, *, description: str):
+    def declare_group(self, group: str, *, description: str, loader: Callable = None):
+        """Declare a group of commands.
+
+        Loader is called with a registry to add commands of the group, only
+        when the group is invoked, so it may import modules its commands need.
+        """
         if self.group_descriptions.get(group) is None:
             self.group_descriptions[group] = description
+        if loader is not None:
+            self.group_loaders.setdefault(group, []).append(loader)
 
     def add_command(
         self,
@@ -31,3 +39,34 @@ class CliRegistry:
             for option in options:
                 command = option(command)
         command_list.append(command)
+
+    def get_group_names(self) -> List[str]:
+        names = list(self.group_commands)
+        names += [name for name in self.group_loaders if name not in names]
+        return names
+
+
+class LazyGroup(click.Group):
+    """Group calling its loaders to add commands, once a command is looked up."""
+
+    def __init__(self, *args, loaders: List[Callable] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaders = list(loaders)
+
+    def _load(self):
+        if not self.loaders:
+            return
+        registry = CliRegistry()
+        for loader in self.loaders:
+            loader(registry)
+        self.loaders = []
+        for command in registry.group_commands.get(self.name, []):
+            self.add_command(command)
+
+    def list_commands(self, ctx):
+        self._load()
+        return super().list_commands(ctx)
+
+    def get_command(self, ctx, cmd_name):
+        self._load()
+        return super().get_command(ctx, cmd_name)
@@ -2,6 +2,7 @@ from typing import Dict
 
 from janeiro.config.loaders import ConfigLoader
 from janeiro.exc import ConfigurationError
+from janeiro.types import UNDEFINED
 
 
 class TestConfigLoader(ConfigLoader):
@@ -9,7 +10,7 @@ class TestConfigLoader(ConfigLoader):
         self.config = config
 
     def get(self, key: str):
-        return self.config.get(key)
+        return self.config.get(key, UNDEFINED)
 
     def raise_missing_key(self, key: str):
         raise ConfigurationError("Missing configuration key: %s" % key)
@@ -0,0 +1,116 @@
+import importlib
+import subprocess
+import sys
+from collections import Counter
+from typing import List, NamedTuple
+
+import click
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+def import_from_string(import_string: str):
+    """Resolve a "module:attribute" string, as used for ASGI factories."""
+    module_name, _, attribute = import_string.partition(":")
+    value = importlib.import_module(module_name)
+    for name in attribute.split("."):
+        value = getattr(value, name)
+    return value
+
+
+class ImportTime(NamedTuple):
+    module: str
+    depth: int
+    # durations in microseconds
+    self_time: int
+    cumulative_time: int
+
+
+def parse_import_times(lines: List[str]) -> List[ImportTime]:
+    """Parse lines written to stderr by python -X importtime."""
+    import_times = []
+    for line in lines:
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        self_time, cumulative_time, module = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if not self_time.strip().isdigit():
+            # header line
+            continue
+        name = module.strip()
+        import_times.append(
+            ImportTime(
+                module=name,
+                depth=(len(module) - len(module.lstrip()) - 1) // 2,
+                self_time=int(self_time),
+                cumulative_time=int(cumulative_time),
+            )
+        )
+    return import_times
+
+
+def format_import_times(import_times: List[ImportTime], limit: int) -> str:
+    total_time = sum(entry.cumulative_time for entry in import_times if not entry.depth)
+    package_times = Counter()
+    for entry in import_times:
+        package_times[entry.module.split(".", 1)[0]] += entry.self_time
+
+    lines = [
+        "Imported %s modules in %.1fms" % (len(import_times), total_time / 1000),
+        "",
+        "Slowest packages, by time spent in their own modules:",
+    ]
+    for package, self_time in package_times.most_common(limit):
+        lines.append("%10.1fms  %s" % (self_time / 1000, package))
+    lines += ["", "Slowest imports, including modules they import:"]
+    slowest = sorted(import_times, key=lambda entry: entry.cumulative_time)
+    for entry in reversed(slowest[-limit:]):
+        lines.append("%10.1fms  %s" % (entry.cumulative_time / 1000, entry.module))
+    return "\n".join(lines)
+
+
+def get_main_command() -> List[str]:
+    """Python arguments running the current CLI again."""
+    spec = getattr(sys.modules["__main__"], "__spec__", None)
+    if spec is not None:
+        return ["-m", spec.name]
+    return [sys.argv[0]]
+
+
+def cmd_import_time(args: tuple, limit: int, run: bool):
+    # commands are only resolved by default, their help being shown instead
+    # of running them, as some start servers or change the database
+    command = [sys.executable, "-X", "importtime", *get_main_command(), *args]
+    if not run:
+        command.append("--help")
+    process = subprocess.run(
+        command,
+        stdout=None if run else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    lines = process.stderr.splitlines()
+    for line in lines:
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            click.echo(line, err=True)
+    click.echo(format_import_times(parse_import_times(lines), limit))
+    if process.returncode:
+        sys.exit(process.returncode)
+
+
+IMPORT_TIME_CMD_OPTIONS = [
+    click.argument("args", nargs=-1, type=click.UNPROCESSED),
+    click.option(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of packages and imports to report.",
+    ),
+    click.option(
+        "--run",
+        is_flag=True,
+        default=False,
+        help="Run the command, instead of only showing its help, to also "
+        "report modules it imports while running.",
+    ),
+]
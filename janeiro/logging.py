@@ -0,0 +1,117 @@
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps_json(data: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return json.dumps(data, default=str, separators=(",", ":"))
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line.
+
+    Structured fields passed as extra={"fields": {...}} are merged in object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "") or None,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return dumps_json(data)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler which drops records instead of blocking when queue is full."""
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # called under handler lock, so counting is thread safe
+            self.dropped += 1
+
+
+class DroppedRecordsListener(QueueListener):
+    """Queue listener which reports records dropped since its last record."""
+
+    def __init__(self, handler: DroppingQueueHandler, *handlers):
+        super().__init__(handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = handler
+        self.reported = 0
+
+    def enqueue_sentinel(self):
+        # wait for room in queue, rather than failing to stop when it is full
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord):
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported:
+            super().handle(
+                logging.makeLogRecord(
+                    {
+                        "name": __name__,
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": "Dropped %s log records while queue was full",
+                        "args": (dropped - self.reported,),
+                        "request_id": "",
+                    }
+                )
+            )
+            self.reported = dropped
+        super().handle(record)
+
+
+class QueueLogging:
+    """Move root logger handlers behind a bounded queue drained by a thread.
+
+    Records are formatted by the calling thread, while the wrapped handlers
+    write them from a background thread, so slow sinks never block callers.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.handler = DroppingQueueHandler(maxsize)
+        self.listener = None
+        self.handlers = []
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def start(self):
+        root = logging.getLogger()
+        self.handlers = root.handlers[:]
+        self.listener = DroppedRecordsListener(self.handler, *self.handlers)
+        root.handlers = [self.handler]
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is None:
+            return
+        root = logging.getLogger()
+        root.handlers = self.handlers
+        # flushes records left in queue before returning
+        self.listener.stop()
+        self.listener = None
@@ -1,9 +1,12 @@
 from logging import getLogger
+from typing import TYPE_CHECKING
 
-from janeiro.api import ApiRegistry
 from janeiro.cli import CliRegistry
 from janeiro.config import Configuration
 
+if TYPE_CHECKING:
+    from janeiro.api import ApiRegistry
+
 
 class PluginType(type):
     def __new__(cls, name, bases, attrs):
@@ -24,11 +27,14 @@ class Plugin(metaclass=PluginType):
     def configure(self, config: Configuration):
         """Method called right at app startup to load user-defined configuration."""
 
-    def extend_api(self, api: ApiRegistry):
+    def extend_api(self, api: "ApiRegistry"):
         """Method that let plugin register endpoints, middlewares and dependencies."""
 
     def extend_cli(self, cli: CliRegistry):
         """Method that let plugin register commands."""
 
+    def startup(self):
+        """Method called before api serves requests, may return an awaitable."""
+
     def cleanup(self):
         """Method called before app shutdown."""
@@ -0,0 +1,744 @@
+import importlib
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Sequence
+
+import click
+
+from janeiro.config import ConfigOption
+from janeiro.exc import ConfigurationError
+from janeiro.plugins import Plugin
+from janeiro.plugins.defaults import PORT_CMD_OPTION
+from janeiro.security import is_valid_token
+
+# names exported by this package, imported from their module on first access
+# so that commands which do not use database do not import SQLAlchemy
+LAZY_EXPORTS = {
+    "EntityCache": "janeiro.plugins.database.cache",
+    "Entity": "janeiro.plugins.database.entity",
+    "ResourceEntity": "janeiro.plugins.database.entity",
+    "DatabaseException": "janeiro.plugins.database.exc",
+    "EntityNotFound": "janeiro.plugins.database.exc",
+    "ExportFormat": "janeiro.plugins.database.export",
+    "BinaryUUID": "janeiro.plugins.database.identifiers",
+    "new_uuid7": "janeiro.plugins.database.identifiers",
+    "uuid7": "janeiro.plugins.database.identifiers",
+    "PoolStatistics": "janeiro.plugins.database.pool",
+    "async_session": "janeiro.plugins.database.session",
+    "async_unit_of_work": "janeiro.plugins.database.session",
+    "bind_engines": "janeiro.plugins.database.session",
+    "get_unit_of_work": "janeiro.plugins.database.session",
+    "unit_of_work": "janeiro.plugins.database.session",
+}
+
+
+def __getattr__(name: str):
+    module_name = LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    return getattr(importlib.import_module(module_name), name)
+
+
+DB_COMMAND_GROUP = "db"
+
+DATABASE_URL_OPTION = ConfigOption(key="database.url", type=str)
+
+DATABASE_REPLICA_URLS_OPTION = ConfigOption(
+    key="database.replica_urls", type=list, default_factory=list
+)
+
+DATABASE_REPLICA_STRATEGY_OPTION = ConfigOption(
+    key="database.replica_strategy", type=str, default="round_robin"
+)
+
+DATABASE_AUTO_MIGRATE_OPTION = ConfigOption(
+    key="database.auto_migrate", type=bool, default=False
+)
+
+DATABASE_SYNC_TIMEOUT_OPTION = ConfigOption(
+    key="database.sync_timeout", type=int, default=30
+)
+
+DATABASE_ASYNC_OPTION = ConfigOption(key="database.async", type=bool, default=False)
+
+# number of connections opened per engine at startup, before serving requests
+DATABASE_POOL_WARMUP_OPTION = ConfigOption(
+    key="database.pool.warmup", type=int, default=0
+)
+
+# pool options left to None fall back on SQLAlchemy defaults for the dialect
+DATABASE_POOL_SIZE_OPTION = ConfigOption(
+    key="database.pool.size", type=int, default=None
+)
+
+DATABASE_POOL_MAX_OVERFLOW_OPTION = ConfigOption(
+    key="database.pool.max_overflow", type=int, default=None
+)
+
+DATABASE_POOL_TIMEOUT_OPTION = ConfigOption(
+    key="database.pool.timeout", type=float, default=None
+)
+
+DATABASE_POOL_RECYCLE_OPTION = ConfigOption(
+    key="database.pool.recycle", type=int, default=None
+)
+
+DATABASE_POOL_PRE_PING_OPTION = ConfigOption(
+    key="database.pool.pre_ping", type=bool, default=False
+)
+
+DATABASE_TIME_ORDERED_UUID_OPTION = ConfigOption(
+    key="database.uuid.time_ordered", type=bool, default=False
+)
+
+DATABASE_INSTRUMENTATION_OPTION = ConfigOption(
+    key="database.instrumentation.enabled", type=bool, default=False
+)
+
+DATABASE_SLOW_QUERY_MS_OPTION = ConfigOption(
+    key="database.instrumentation.slow_query_ms", type=float, default=100.0
+)
+
+DATABASE_N_PLUS_ONE_THRESHOLD_OPTION = ConfigOption(
+    key="database.instrumentation.n_plus_one_threshold", type=int, default=5
+)
+
+# slow queries route is not registered unless a token is configured
+DATABASE_INSTRUMENTATION_TOKEN_OPTION = ConfigOption(
+    key="database.instrumentation.token", type=str, default=None
+)
+
+TOKEN_HEADER = "X-Database-Token"
+
+DATABASE_BULK_CHUNK_SIZE_OPTION = ConfigOption(
+    key="database.bulk.chunk_size", type=int, default=1000
+)
+
+# sync drivers used by CLI commands and migrations, by async driver, so
+# that they do not require another database library
+SYNC_DRIVERS = {
+    "asyncpg": "psycopg",
+    "psycopg": "psycopg",
+    "psycopg_async": "psycopg",
+    "aiosqlite": "pysqlite",
+    "aiomysql": "pymysql",
+    "asyncmy": "pymysql",
+}
+
+# bounds (in seconds) of the delay between connection attempts
+PING_INITIAL_DELAY = 0.1
+PING_MAX_DELAY = 5.0
+
+TIMEOUT_CMD_OPTION = click.option(
+    "-t",
+    "--timeout",
+    type=int,
+    default=0,
+    help="Number of seconds to wait for DB connection to be available",
+)
+
+
+def get_sync_url(database_url: str) -> str:
+    """Return URL of the sync driver matching the async driver of database URL.
+
+    Drivers which are not known to be async are kept as they are.
+    """
+    from sqlalchemy import make_url
+
+    url = make_url(database_url)
+    _, _, driver = url.drivername.partition("+")
+    sync_driver = SYNC_DRIVERS.get(driver)
+    if sync_driver is not None:
+        url = url.set(drivername="%s+%s" % (url.get_backend_name(), sync_driver))
+    return url.render_as_string(hide_password=False)
+
+
+class DatabasePlugin(Plugin):
+    __plugin__ = "database"
+
+    def __init__(
+        self,
+        migrations_module: str = None,
+        pool_stats_path: str = "/database/pool",
+        slow_queries_path: str = "/database/slow-queries",
+        entity_modules: Sequence[str] = (),
+    ) -> None:
+        super().__init__()
+        # modules declaring entities, imported along with engines so that
+        # commands and migrations know every table
+        self.entity_modules = entity_modules
+        self.pool_stats_path = pool_stats_path
+        self.slow_queries_path = slow_queries_path
+        self.script_heads = None
+        self.engines_ready = False
+        self.sync_engine = None
+        self.migrations_module = importlib.import_module(migrations_module)
+        self.migrations_folder = str(self.migrations_module.__path__[0])
+
+    def _get_alembic_config(self):
+        import alembic.config
+
+        self.setup_engines()
+        alembic_config = alembic.config.Config()
+        alembic_config.set_main_option("script_location", self.migrations_folder)
+        alembic_config.set_main_option("sqlalchemy.url", self.sync_database_url)
+        return alembic_config
+
+    def _get_script_heads(self):
+        # parsing revision scripts is slow, and they do not change at runtime
+        if self.script_heads is None:
+            import alembic.script
+
+            config = self._get_alembic_config()
+            directory = alembic.script.ScriptDirectory.from_config(config)
+            self.script_heads = directory.get_heads()
+        return self.script_heads
+
+    def _get_current_revisions(self):
+        from alembic.runtime.migration import MigrationContext
+
+        with self.engine.connect() as connection:
+            return MigrationContext.configure(connection).get_current_heads()
+
+    def wait_for_database(self, timeout: float) -> bool:
+        """Try to connect until timeout, doubling delay after each failure."""
+        import sqlalchemy.exc
+
+        self.setup_engines()
+        deadline = time.monotonic() + timeout
+        delay = PING_INITIAL_DELAY
+        while True:
+            try:
+                self.engine.connect().close()
+                return True
+            except sqlalchemy.exc.OperationalError as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.logger.warning(
+                    "Database unavailable, retrying in %.1fs: %s", delay, error.orig
+                )
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, PING_MAX_DELAY)
+
+    def sync_database(self, timeout: float) -> bool:
+        """Wait for database and upgrade it if behind revision scripts.
+
+        Upgrade is run under a database lock, as API workers start at once.
+        """
+        import alembic.command
+
+        from janeiro.plugins.database.exc import DatabaseException
+        from janeiro.plugins.database.migrations import migration_lock
+
+        if not self.wait_for_database(timeout):
+            raise DatabaseException("Database unavailable after %ss" % timeout)
+        heads = set(self._get_script_heads())
+        if set(self._get_current_revisions()) == heads:
+            self.logger.info("Database is up to date: %s", ", ".join(heads))
+            return False
+        with migration_lock(self.engine):
+            # another process may have upgraded database while waiting for lock
+            current_revisions = set(self._get_current_revisions())
+            if current_revisions == heads:
+                self.logger.info("Database is up to date: %s", ", ".join(heads))
+                return False
+            self.logger.info(
+                "Upgrading database from %s to %s",
+                ", ".join(current_revisions) or "empty",
+                ", ".join(heads),
+            )
+            alembic.command.upgrade(self._get_alembic_config(), "heads")
+        return True
+
+    def cmd_db_init(self):
+        from janeiro.plugins.database.entity import Entity
+
+        self.setup_engines()
+        Entity.metadata.create_all(self.engine)
+
+    def cmd_db_ping(self, timeout: int):
+        click.echo("Pinging DB")
+        if not self.wait_for_database(timeout):
+            click.echo("Failed", file=sys.stderr)
+            sys.exit(1)
+
+    def cmd_db_sync(self, timeout: int):
+        from janeiro.plugins.database.exc import DatabaseException
+
+        try:
+            upgraded = self.sync_database(timeout)
+        except DatabaseException as error:
+            click.echo(str(error), file=sys.stderr)
+            sys.exit(1)
+        click.echo("Database upgraded" if upgraded else "Database is up to date")
+
+    def cmd_db_pool_stats(self, port: int):
+        pool_stats_url = "http://127.0.0.1:%s%s" % (port, self.pool_stats_path)
+        try:
+            response = urllib.request.urlopen(pool_stats_url)
+        except urllib.error.URLError as error:
+            click.echo(
+                "Failed to fetch pool statistics from %s: %s" % (pool_stats_url, error),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        click.echo(json.dumps(json.load(response), indent=2))
+
+    def _fetch_slow_queries(self, port: int) -> list:
+        if self.instrumentation_token is None:
+            click.echo(
+                "Slow queries route is disabled, set database.instrumentation.token",
+                err=True,
+            )
+            sys.exit(1)
+        slow_queries_url = "http://127.0.0.1:%s%s" % (port, self.slow_queries_path)
+        request = urllib.request.Request(
+            slow_queries_url, headers={TOKEN_HEADER: self.instrumentation_token}
+        )
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.URLError as error:
+            click.echo(
+                "Failed to fetch slow queries from %s: %s" % (slow_queries_url, error),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        return json.load(response)
+
+    def cmd_db_explain(self, port: int, input: str, limit: int):
+        import sqlalchemy.exc
+
+        from janeiro.plugins.database.entity import Entity
+        from janeiro.plugins.database.exc import DatabaseException
+        from janeiro.plugins.database.explain import (
+            explain,
+            is_explainable,
+            render_index_revision,
+        )
+
+        if input is None:
+            slow_queries = self._fetch_slow_queries(port)
+        else:
+            with open(input) as slow_queries_file:
+                slow_queries = json.load(slow_queries_file)
+
+        missing_indexes = {}
+        self.setup_engines()
+        with self.engine.connect() as connection:
+            for slow_query in slow_queries[:limit]:
+                statement = slow_query["statement"]
+                click.echo(
+                    "-- %.1fms max, %s calls\n%s"
+                    % (slow_query["max_ms"], slow_query["count"], statement)
+                )
+                if not is_explainable(statement):
+                    click.echo("(skipped: statement can not be explained)\n")
+                    continue
+                if slow_query["parameters"] is None:
+                    click.echo("(skipped: parameters of statement are not kept)\n")
+                    continue
+                try:
+                    plan = explain(
+                        connection, Entity.metadata, statement, slow_query["parameters"]
+                    )
+                except DatabaseException as error:
+                    click.echo(str(error), err=True)
+                    sys.exit(1)
+                except sqlalchemy.exc.DBAPIError as error:
+                    click.echo("(failed: %s)\n" % error.orig, file=sys.stderr)
+                    continue
+                finally:
+                    connection.rollback()
+                for line in plan.lines:
+                    click.echo("  " + line)
+                for table_name, columns in plan.missing_indexes.items():
+                    click.echo(
+                        "  full scan of %s, consider indexing: %s"
+                        % (table_name, ", ".join(columns))
+                    )
+                    missing_indexes.setdefault(table_name, set()).update(columns)
+                click.echo()
+
+        if missing_indexes:
+            click.echo(
+                "# Suggested migration, create it with: db revision -m <message>"
+            )
+            click.echo(render_index_revision(missing_indexes))
+        else:
+            click.echo("No missing index detected.")
+
+    def cmd_db_load(self, path: str, table: str, format: str, chunk_size: int):
+        from janeiro.plugins.database.exc import DatabaseException
+        from janeiro.plugins.database.load import (
+            coerce_rows,
+            get_entity,
+            get_format,
+            load_rows,
+            read_rows,
+        )
+
+        self.setup_engines()
+        try:
+            entity = get_entity(table)
+            format = get_format(path, format)
+        except DatabaseException as error:
+            click.echo(str(error), file=sys.stderr)
+            sys.exit(1)
+
+        def echo_progress(count: int, elapsed: float):
+            click.echo(
+                "Loaded %s rows (%.0f rows/s)" % (count, count / elapsed), err=True
+            )
+
+        with open(path, newline="") as file:
+            rows = coerce_rows(entity.__table__, read_rows(file, format))
+            try:
+                count = load_rows(self.engine, entity, rows, chunk_size, echo_progress)
+            except DatabaseException as error:
+                click.echo(str(error), file=sys.stderr)
+                sys.exit(1)
+        click.echo("Loaded %s rows into %s" % (count, entity.__tablename__))
+
+    def cmd_db_revision(self, message: str):
+        import alembic.command
+        import alembic.script
+
+        config = self._get_alembic_config()
+        directory = alembic.script.ScriptDirectory.from_config(config)
+        try:
+            latest_revision = max(
+                int(script.revision) for script in directory.walk_revisions()
+            )
+        except ValueError:
+            latest_revision = 0
+        rev_id = str(latest_revision + 1).zfill(4)
+        alembic.command.revision(config, message, autogenerate=True, rev_id=rev_id)
+
+    def cmd_db_upgrade(self, revision: str = None):
+        import alembic.command
+
+        if revision is None:
+            revision = "heads"
+        config = self._get_alembic_config()
+        alembic.command.upgrade(config, revision)
+
+    def cmd_db_downgrade(self, revision: str):
+        import alembic.command
+
+        config = self._get_alembic_config()
+        alembic.command.downgrade(config, revision)
+
+    def configure(self, config):
+        # parse config options, engines are created once they are needed
+        self.database_url = config.get(DATABASE_URL_OPTION)
+        self.auto_migrate = config.get(DATABASE_AUTO_MIGRATE_OPTION)
+        self.sync_timeout = config.get(DATABASE_SYNC_TIMEOUT_OPTION)
+        self.pool_warmup = config.get(DATABASE_POOL_WARMUP_OPTION)
+        self.async_mode = config.get(DATABASE_ASYNC_OPTION)
+        self.bulk_chunk_size = config.get(DATABASE_BULK_CHUNK_SIZE_OPTION)
+        self.time_ordered_uuid = config.get(DATABASE_TIME_ORDERED_UUID_OPTION)
+        self.pool_options = {
+            "pool_size": config.get(DATABASE_POOL_SIZE_OPTION),
+            "max_overflow": config.get(DATABASE_POOL_MAX_OVERFLOW_OPTION),
+            "pool_timeout": config.get(DATABASE_POOL_TIMEOUT_OPTION),
+            "pool_recycle": config.get(DATABASE_POOL_RECYCLE_OPTION),
+            "pool_pre_ping": config.get(DATABASE_POOL_PRE_PING_OPTION),
+        }
+        self.replica_urls = config.get(DATABASE_REPLICA_URLS_OPTION)
+        self.replica_strategy = config.get(DATABASE_REPLICA_STRATEGY_OPTION)
+        self.instrumentation_enabled = config.get(DATABASE_INSTRUMENTATION_OPTION)
+        self.instrumentation_token = config.get(DATABASE_INSTRUMENTATION_TOKEN_OPTION)
+        self.slow_query_threshold = config.get(DATABASE_SLOW_QUERY_MS_OPTION) / 1000
+        self.n_plus_one_threshold = config.get(DATABASE_N_PLUS_ONE_THRESHOLD_OPTION)
+
+    def setup_engines(self):
+        """Create engines and bind them to sessions, unless already done.
+
+        Called when building the API and by commands using the database, so
+        that other commands do not import SQLAlchemy.
+        """
+        if self.engines_ready:
+            return
+
+        from janeiro.plugins.database.entity import Entity, ResourceEntity
+        from janeiro.plugins.database.identifiers import new_uuid7
+        from janeiro.plugins.database.instrumentation import QueryInstrumentation
+        from janeiro.plugins.database.pool import PoolStatistics
+        from janeiro.plugins.database.session import REPLICA_STRATEGIES
+
+        if self.replica_strategy not in REPLICA_STRATEGIES:
+            raise ConfigurationError(
+                "Invalid replica strategy: %s (expected one of: %s)"
+                % (self.replica_strategy, ", ".join(REPLICA_STRATEGIES))
+            )
+        Entity.__chunk_size__ = self.bulk_chunk_size
+        if self.time_ordered_uuid:
+            ResourceEntity.__uuid_factory__ = staticmethod(new_uuid7)
+        # in async mode, sync engine used by CLI commands and migrations is
+        # only created once needed, as its driver may not be installed
+        self.pool_statistics = PoolStatistics()
+        self.async_engine = None
+        if self.async_mode:
+            self.sync_database_url = get_sync_url(self.database_url)
+            self.async_engine = self._create_engine(
+                self.database_url, self.pool_statistics
+            )
+        else:
+            self.sync_database_url = self.database_url
+            self.sync_engine = self._create_engine(
+                self.database_url, self.pool_statistics
+            )
+        self.replica_pool_statistics = [PoolStatistics() for _ in self.replica_urls]
+        self.replica_engines = [
+            self._create_engine(url, statistics)
+            for url, statistics in zip(self.replica_urls, self.replica_pool_statistics)
+        ]
+        self.instrumentation = None
+        if self.instrumentation_enabled:
+            self.instrumentation = QueryInstrumentation(
+                self.logger,
+                slow_query_threshold=self.slow_query_threshold,
+                n_plus_one_threshold=self.n_plus_one_threshold,
+            )
+            self.instrumentation.listen(self.async_engine or self.sync_engine)
+            for replica_engine in self.replica_engines:
+                self.instrumentation.listen(replica_engine)
+        for module_name in self.entity_modules:
+            importlib.import_module(module_name)
+        self.engines_ready = True
+        self._bind_engines()
+
+    def _bind_engines(self):
+        from janeiro.plugins.database.session import bind_engines
+
+        bind_engines(
+            self.sync_engine,
+            self.async_engine,
+            replicas=self.replica_engines,
+            replica_strategy=self.replica_strategy,
+        )
+
+    @property
+    def engine(self):
+        """Sync engine, created on first access in async mode."""
+        self.setup_engines()
+        if self.sync_engine is None:
+            from sqlalchemy import create_engine
+
+            self.sync_engine = create_engine(self.sync_database_url)
+            self._bind_engines()
+        return self.sync_engine
+
+    def _create_engine(self, database_url: str, statistics):
+        from sqlalchemy import create_engine
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        from janeiro.plugins.database.pool import create_instrumented_engine
+
+        create = create_async_engine if self.async_mode else create_engine
+        return create_instrumented_engine(
+            create, database_url, statistics, **self.pool_options
+        )
+
+    def startup(self):
+        from janeiro.plugins.database.pool import warm_up
+
+        if self.auto_migrate:
+            self.sync_database(self.sync_timeout)
+        if self.pool_warmup:
+            engines = [self.async_engine or self.engine, *self.replica_engines]
+            if self.async_mode:
+                return self._async_warm_up(engines)
+            count = warm_up(engines, self.pool_warmup)
+            self.logger.info("Opened %s pooled connections", count)
+
+    async def _async_warm_up(self, engines):
+        from janeiro.plugins.database.pool import async_warm_up
+
+        count = await async_warm_up(engines, self.pool_warmup)
+        self.logger.info("Opened %s pooled connections", count)
+
+    def endpoint_pool_stats(self):
+        from janeiro.plugins.database.pool import get_pool
+
+        engine = self.async_engine if self.async_mode else self.engine
+        pool_stats = self.pool_statistics.as_dict(get_pool(engine))
+        if self.replica_engines:
+            pool_stats["replicas"] = [
+                statistics.as_dict(get_pool(replica))
+                for replica, statistics in zip(
+                    self.replica_engines, self.replica_pool_statistics
+                )
+            ]
+        return pool_stats
+
+    def extend_api(self, api):
+        from fastapi import Depends, Header, HTTPException
+
+        from janeiro.plugins.database.instrumentation import (
+            QueryInstrumentationMiddleware,
+        )
+        from janeiro.plugins.database.middleware import UnitOfWorkMiddleware
+
+        self.setup_engines()
+        api.add_middleware(UnitOfWorkMiddleware)
+        if self.instrumentation is not None:
+            # added last to wrap unit of work, so that its commit is measured
+            api.add_middleware(
+                QueryInstrumentationMiddleware, instrumentation=self.instrumentation
+            )
+            if self.instrumentation_token is not None:
+                # slow statements may reveal data through their parameters
+                def check_token(x_database_token: str = Header(None)):
+                    if not is_valid_token(x_database_token, self.instrumentation_token):
+                        raise HTTPException(
+                            status_code=403, detail="Invalid database token"
+                        )
+
+                api.add_api_route(
+                    self.slow_queries_path,
+                    self.instrumentation.slow_queries.as_list,
+                    dependencies=[Depends(check_token)],
+                )
+        api.add_api_route(self.pool_stats_path, self.endpoint_pool_stats)
+
+    def extend_cli(self, cli):
+        cli.declare_group(
+            DB_COMMAND_GROUP,
+            description="Commands to manage database",
+            loader=self._extend_db_cli,
+        )
+
+    def _extend_db_cli(self, cli):
+        from janeiro.plugins.database.export import ExportFormat
+
+        cli.add_command(
+            self.cmd_db_init,
+            name="init",
+            help="Initialize database schemas and tables.",
+            group=DB_COMMAND_GROUP,
+        )
+
+        cli.add_command(
+            self.cmd_db_ping,
+            name="ping",
+            help="Performs a database connection test.",
+            group=DB_COMMAND_GROUP,
+            options=[TIMEOUT_CMD_OPTION],
+        )
+
+        cli.add_command(
+            self.cmd_db_pool_stats,
+            name="pool-stats",
+            help="Show connection pool statistics of a running API.",
+            group=DB_COMMAND_GROUP,
+            options=[PORT_CMD_OPTION],
+        )
+
+        cli.add_command(
+            self.cmd_db_explain,
+            name="explain",
+            help="Explain slow queries of a running API and suggest missing indexes.",
+            group=DB_COMMAND_GROUP,
+            options=[
+                PORT_CMD_OPTION,
+                click.option(
+                    "-i",
+                    "--input",
+                    default=None,
+                    help="JSON file of slow queries to explain instead of a running API.",
+                ),
+                click.option(
+                    "-n",
+                    "--limit",
+                    type=int,
+                    default=10,
+                    help="Maximum number of slow queries to explain.",
+                ),
+            ],
+        )
+
+        cli.add_command(
+            self.cmd_db_load,
+            name="load",
+            help="Bulk import rows of a CSV or NDJSON file into an entity table.",
+            group=DB_COMMAND_GROUP,
+            options=[
+                click.argument("path", type=click.Path(exists=True, dir_okay=False)),
+                click.option(
+                    "-t",
+                    "--table",
+                    required=True,
+                    help="Table or class name of the entity to load rows into.",
+                ),
+                click.option(
+                    "-f",
+                    "--format",
+                    type=click.Choice([format.value for format in ExportFormat]),
+                    default=None,
+                    help="Format of the file. Left empty means guessed from extension.",
+                ),
+                click.option(
+                    "-c",
+                    "--chunk-size",
+                    type=int,
+                    default=None,
+                    help="Number of rows inserted per transaction.",
+                ),
+            ],
+        )
+
+        if self.migrations_folder:
+            cli.add_command(
+                self.cmd_db_revision,
+                name="revision",
+                help="Automatically create a new database revision",
+                group=DB_COMMAND_GROUP,
+                options=[
+                    click.option(
+                        "-m", "--message", help="Short message describing revision"
+                    )
+                ],
+            )
+
+            cli.add_command(
+                self.cmd_db_upgrade,
+                name="upgrade",
+                help="Upgrade database structure to specified revision.",
+                group=DB_COMMAND_GROUP,
+                options=[
+                    click.option(
+                        "-r",
+                        "--revision",
+                        default=None,
+                        help="Identifier of the up revision to apply. Left empty means latest.",
+                    )
+                ],
+            )
+
+            cli.add_command(
+                self.cmd_db_downgrade,
+                name="downgrade",
+                help="Downgrade database structure to specified revision.",
+                group=DB_COMMAND_GROUP,
+                options=[
+                    click.option(
+                        "-r",
+                        "--revision",
+                        help="Identifier of the down revision to apply. Left empty means previous.",
+                    )
+                ],
+            )
+
+            cli.add_command(
+                self.cmd_db_sync,
+                name="sync",
+                help="Block until DB is up and latest revision is applied",
+                group=DB_COMMAND_GROUP,
+                options=[TIMEOUT_CMD_OPTION],
+            )
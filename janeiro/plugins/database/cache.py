@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# keys invalidated by a session, invalidated again once it commits
+PENDING_INVALIDATIONS_KEY = "janeiro.cache.pending_invalidations"
+
+# set once a session sent writes to database, until its transaction ends
+UNCOMMITTED_WRITES_KEY = "janeiro.cache.uncommitted_writes"
+
+
+class EntityCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.aliases = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, primary_key: Hashable):
+        _, _, keys = self.entries.pop(primary_key)
+        for key in keys:
+            self.aliases.pop(key, None)
+
+    def get(self, key: Hashable) -> Dict[str, Any]:
+        with self.lock:
+            primary_key = self.aliases.get(key)
+            entry = self.entries.get(primary_key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(primary_key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(primary_key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, keys: Sequence[Hashable], values: Dict[str, Any]):
+        """Cache values under several keys, the first one being the primary."""
+        primary_key = keys[0]
+        with self.lock:
+            if primary_key in self.entries:
+                self._remove(primary_key)
+            self.entries[primary_key] = (time.monotonic() + self.ttl, values, keys)
+            for key in keys:
+                self.aliases[key] = primary_key
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self.lock:
+            primary_key = self.aliases.get(key)
+            if primary_key is not None:
+                self._remove(primary_key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.aliases.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def invalidate(session: Session, cache: EntityCache, key: Hashable = None):
+    """Invalidate key (or whole cache) now and again when session commits.
+
+    Invalidating on commit prevents concurrent sessions from caching values
+    read between the write and its commit.
+    """
+    if key is None:
+        cache.clear()
+    else:
+        cache.invalidate(key)
+    session.info.setdefault(PENDING_INVALIDATIONS_KEY, []).append((cache, key))
+
+
+def has_pending_invalidations(session: Session) -> bool:
+    return bool(session.info.get(PENDING_INVALIDATIONS_KEY))
+
+
+def has_uncommitted_writes(session: Session) -> bool:
+    """Whether values read by session may be rolled back along with its writes."""
+    return bool(
+        session.info.get(UNCOMMITTED_WRITES_KEY)
+        or has_pending_invalidations(session)
+        or session.new
+        or session.deleted
+        or session.dirty
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_writes(session: Session, flush_context):
+    session.info[UNCOMMITTED_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_executed_writes(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[UNCOMMITTED_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session):
+    session.info.pop(UNCOMMITTED_WRITES_KEY, None)
+    for cache, key in session.info.pop(PENDING_INVALIDATIONS_KEY, ()):
+        if key is None:
+            cache.clear()
+        else:
+            cache.invalidate(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending_invalidations(session: Session):
+    session.info.pop(UNCOMMITTED_WRITES_KEY, None)
+    session.info.pop(PENDING_INVALIDATIONS_KEY, None)
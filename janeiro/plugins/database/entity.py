@@ -0,0 +1,350 @@
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, List
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    String,
+    delete,
+    insert,
+    inspect,
+    update,
+)
+from sqlalchemy.orm import DeclarativeBase, Session, make_transient_to_detached
+
+from janeiro.plugins.database.cache import (
+    EntityCache,
+    has_uncommitted_writes,
+    invalidate,
+)
+from janeiro.plugins.database.exc import EntityNotFound
+from janeiro.plugins.database.identifiers import new_uuid4
+from janeiro.plugins.database.loader import get_loader
+from janeiro.plugins.database.pagination import (
+    Page,
+    after_cursor,
+    decode_cursor,
+    encode_cursor,
+)
+from janeiro.plugins.database.session import autocommit, run_async, run_in_session
+
+
+def iter_chunks(rows: Iterable, size: int):
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+class Entity(DeclarativeBase):
+    """Base class of entities, whose methods run in the current session.
+
+    Methods return their result in sync mode, but an awaitable when database
+    runs in async mode. Their counterparts prefixed with "a" are coroutines in
+    both modes, which run sync sessions in threadpool.
+    """
+
+    # number of rows sent per statement (and per transaction) by bulk methods
+    __chunk_size__ = 1000
+    # opt-in read-through cache used by get methods, disabled when None
+    __cache__: EntityCache = None
+    # unique attributes under which cached entities can be looked up
+    __cache_keys__ = ("id",)
+    # unique and indexed ordering used to paginate entities
+    __pagination_keys__ = ("id",)
+
+    id = Column(Integer, primary_key=True)
+
+    @classmethod
+    def get_by_id(cls, id: int):
+        return run_in_session(cls._get_by_id, id)
+
+    @classmethod
+    def create(cls, data: dict):
+        return run_in_session(cls._create, data)
+
+    def update(self, data: dict):
+        return run_in_session(self._update, data)
+
+    def delete(self):
+        return run_in_session(self._delete)
+
+    @classmethod
+    def load_by_id(cls, id: int):
+        """Await entity by id, fetched along with other concurrent loads."""
+        return get_loader(cls, "id").load(id)
+
+    @classmethod
+    def paginate(cls, limit: int = 50, cursor: str = None):
+        """Return a page of entities located after the opaque cursor."""
+        return run_in_session(cls._paginate, limit, cursor)
+
+    @classmethod
+    def bulk_create(cls, rows: Iterable[dict], chunk_size: int = None):
+        """Insert rows by chunks and return the number of rows inserted."""
+        return run_in_session(cls._bulk_create, rows, chunk_size)
+
+    @classmethod
+    def bulk_update(cls, rows: Iterable[dict], chunk_size: int = None):
+        """Update rows matched by the id found in each of them, by chunks."""
+        return run_in_session(cls._bulk_update, rows, chunk_size)
+
+    @classmethod
+    def update_where(cls, values: dict, *criteria):
+        """Update all rows matching criteria and return their count."""
+        return run_in_session(cls._update_where, values, *criteria)
+
+    @classmethod
+    def delete_by_ids(cls, ids: Iterable[int], chunk_size: int = None):
+        """Delete rows by chunks of ids and return the number of rows deleted."""
+        return run_in_session(cls._delete_by_ids, ids, chunk_size)
+
+    @classmethod
+    async def aget_by_id(cls, id: int):
+        return await run_async(cls._get_by_id, id)
+
+    @classmethod
+    async def acreate(cls, data: dict):
+        return await run_async(cls._create, data)
+
+    async def aupdate(self, data: dict):
+        return await run_async(self._update, data)
+
+    async def adelete(self):
+        return await run_async(self._delete)
+
+    @classmethod
+    async def apaginate(cls, limit: int = 50, cursor: str = None):
+        return await run_async(cls._paginate, limit, cursor)
+
+    @classmethod
+    async def abulk_create(cls, rows: Iterable[dict], chunk_size: int = None):
+        return await run_async(cls._bulk_create, rows, chunk_size)
+
+    @classmethod
+    async def abulk_update(cls, rows: Iterable[dict], chunk_size: int = None):
+        return await run_async(cls._bulk_update, rows, chunk_size)
+
+    @classmethod
+    async def aupdate_where(cls, values: dict, *criteria):
+        return await run_async(cls._update_where, values, *criteria)
+
+    @classmethod
+    async def adelete_by_ids(cls, ids: Iterable[int], chunk_size: int = None):
+        return await run_async(cls._delete_by_ids, ids, chunk_size)
+
+    @classmethod
+    def _prepare_create_rows(cls, rows: List[dict]) -> List[dict]:
+        return rows
+
+    @classmethod
+    def _prepare_update_rows(cls, rows: List[dict]) -> List[dict]:
+        return rows
+
+    @classmethod
+    def _get_by_id(cls, session: Session, id: int):
+        return cls._get_by(session, "id", id)
+
+    @classmethod
+    def _get_by(cls, session: Session, attr: str, value):
+        entity = cls._load_from_cache(session, attr, value)
+        if entity is None:
+            entity = session.query(cls).filter(getattr(cls, attr) == value).first()
+            if entity is None:
+                raise EntityNotFound(f"{cls.__name__} with {attr}={value} not found.")
+            cls._save_to_cache(session, entity)
+        return entity
+
+    @classmethod
+    def _get_many_by(cls, session: Session, attr: str, values: List):
+        entities = {}
+        missing_values = []
+        for value in values:
+            entity = cls._load_from_cache(session, attr, value)
+            if entity is None:
+                missing_values.append(value)
+            else:
+                entities[value] = entity
+
+        column = getattr(cls, attr)
+        for chunk in iter_chunks(missing_values, cls.__chunk_size__):
+            for entity in session.query(cls).filter(column.in_(chunk)):
+                cls._save_to_cache(session, entity)
+                entities[getattr(entity, attr)] = entity
+        return entities
+
+    @classmethod
+    def _paginate(cls, session: Session, limit: int, cursor: str = None):
+        columns = [getattr(cls, key) for key in cls.__pagination_keys__]
+        query = session.query(cls).order_by(*columns)
+        if cursor is not None:
+            query = query.filter(after_cursor(columns, decode_cursor(cursor, columns)))
+        # fetching an extra entity tells whether there is a next page
+        items = query.limit(limit + 1).all()
+        if len(items) <= limit:
+            return Page(items=items)
+        items = items[:limit]
+        last_values = [getattr(items[-1], key) for key in cls.__pagination_keys__]
+        return Page(items=items, next_cursor=encode_cursor(last_values))
+
+    @classmethod
+    def _get_cache_key(cls, attr: str, value) -> tuple:
+        # a cache may be shared by entities, through a common base class
+        return (cls.__table__.name, attr, value)
+
+    @classmethod
+    def _load_from_cache(cls, session: Session, attr: str, value):
+        if cls.__cache__ is None:
+            return None
+        values = cls.__cache__.get(cls._get_cache_key(attr, value))
+        if values is None:
+            return None
+        entity = session.identity_map.get(session.identity_key(cls, values["id"]))
+        if entity is None:
+            # attach entity as if it had been loaded, without querying database
+            entity = cls(**values)
+            make_transient_to_detached(entity)
+            session.add(entity)
+        return entity
+
+    @classmethod
+    def _save_to_cache(cls, session: Session, entity: "Entity"):
+        # values read by a session with uncommitted writes may be rolled back
+        if cls.__cache__ is None or has_uncommitted_writes(session):
+            return
+        values = {
+            attr.key: getattr(entity, attr.key) for attr in inspect(cls).column_attrs
+        }
+        keys = [cls._get_cache_key(attr, values[attr]) for attr in cls.__cache_keys__]
+        cls.__cache__.set(keys, values)
+
+    @classmethod
+    def _invalidate_cache(cls, session: Session, id: int = None):
+        if cls.__cache__ is not None:
+            key = None if id is None else cls._get_cache_key("id", id)
+            invalidate(session, cls.__cache__, key)
+
+    @classmethod
+    def _create(cls, session: Session, data: dict):
+        instance = cls()
+        session.add(instance)
+        instance._update(session, data)
+        return instance
+
+    def _update(self, session: Session, data: dict):
+        for attr, value in data.items():
+            setattr(self, attr, value)
+        if self.id is not None:
+            self._invalidate_cache(session, self.id)
+        else:
+            # generated keys of new entities must be known before a unit of
+            # work commits, which may be after they are returned
+            session.flush()
+        autocommit(session)
+
+    def _delete(self, session: Session):
+        session.delete(self)
+        self._invalidate_cache(session, self.id)
+        autocommit(session)
+
+    @classmethod
+    def _bulk_create(cls, session: Session, rows: Iterable[dict], chunk_size: int):
+        count = 0
+        for chunk in iter_chunks(rows, chunk_size or cls.__chunk_size__):
+            session.execute(insert(cls), cls._prepare_create_rows(chunk))
+            autocommit(session)
+            count += len(chunk)
+        return count
+
+    @classmethod
+    def _bulk_update(cls, session: Session, rows: Iterable[dict], chunk_size: int):
+        count = 0
+        for chunk in iter_chunks(rows, chunk_size or cls.__chunk_size__):
+            for row in chunk:
+                cls._invalidate_cache(session, row["id"])
+            session.execute(update(cls), cls._prepare_update_rows(chunk))
+            autocommit(session)
+            count += len(chunk)
+        return count
+
+    @classmethod
+    def _update_where(cls, session: Session, values: dict, *criteria):
+        (values,) = cls._prepare_update_rows([values])
+        cls._invalidate_cache(session)
+        result = session.execute(update(cls).where(*criteria).values(values))
+        autocommit(session)
+        return result.rowcount
+
+    @classmethod
+    def _delete_by_ids(cls, session: Session, ids: Iterable[int], chunk_size: int):
+        count = 0
+        for chunk in iter_chunks(ids, chunk_size or cls.__chunk_size__):
+            for id in chunk:
+                cls._invalidate_cache(session, id)
+            result = session.execute(delete(cls).where(cls.id.in_(chunk)))
+            autocommit(session)
+            count += result.rowcount
+        return count
+
+
+class ResourceEntity(Entity):
+    __abstract__ = True
+
+    uuid = Column(String(32), unique=True, index=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    updated_at = Column(DateTime, nullable=True)
+
+    __cache_keys__ = ("id", "uuid")
+    __pagination_keys__ = ("created_at", "id")
+    # generates hex uuid of new entities, which may be stored as BinaryUUID
+    __uuid_factory__ = staticmethod(new_uuid4)
+
+    @classmethod
+    def get_by_uuid(cls, uuid: str):
+        return run_in_session(cls._get_by_uuid, uuid)
+
+    @classmethod
+    async def aget_by_uuid(cls, uuid: str):
+        return await run_async(cls._get_by_uuid, uuid)
+
+    @classmethod
+    def load_by_uuid(cls, uuid: str):
+        """Await entity by uuid, fetched along with other concurrent loads."""
+        return get_loader(cls, "uuid").load(uuid)
+
+    @classmethod
+    def _get_by_uuid(cls, session: Session, uuid: str):
+        return cls._get_by(session, "uuid", uuid)
+
+    @classmethod
+    def _create(cls, session: Session, data: dict):
+        data["created_at"] = datetime.utcnow()
+        if data.get("uuid") is None:
+            data["uuid"] = cls.__uuid_factory__()
+        return super()._create(session, data)
+
+    def _update(self, session: Session, data: dict):
+        data["updated_at"] = datetime.utcnow()
+        return super()._update(session, data)
+
+    @classmethod
+    def _prepare_create_rows(cls, rows: List[dict]) -> List[dict]:
+        now = datetime.utcnow()
+        return [
+            {
+                **row,
+                "uuid": row.get("uuid") or cls.__uuid_factory__(),
+                # timestamps of loaded or backfilled rows are kept
+                "created_at": row.get("created_at") or now,
+                "updated_at": row.get("updated_at") or now,
+            }
+            for row in rows
+        ]
+
+    @classmethod
+    def _prepare_update_rows(cls, rows: List[dict]) -> List[dict]:
+        now = datetime.utcnow()
+        return [{**row, "updated_at": now} for row in rows]
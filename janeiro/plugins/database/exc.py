@@ -0,0 +1,10 @@
+class DatabaseException(Exception):
+    ...
+
+
+class EntityNotFound(Exception):
+    ...
+
+
+class InvalidCursor(DatabaseException):
+    ...
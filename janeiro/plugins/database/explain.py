@@ -0,0 +1,158 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from sqlalchemy import (
+    Connection,
+    MetaData,
+    PrimaryKeyConstraint,
+    Table,
+    UniqueConstraint,
+)
+
+from janeiro.plugins.database.exc import DatabaseException
+
+# statement kinds which can be explained without side effects
+EXPLAINABLE_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)")
+
+
+@dataclass
+class QueryPlan:
+    statement: str
+    lines: List[str]
+    full_scans: List[str] = field(default_factory=list)
+    missing_indexes: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def _explain_sqlite(connection: Connection, statement: str, parameters):
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+    lines = [row[-1] for row in rows]
+    full_scans = [
+        match.group(1) for match in map(SQLITE_FULL_SCAN.match, lines) if match
+    ]
+    return lines, full_scans
+
+
+def _walk_postgresql_plan(node: dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", ()):
+        yield from _walk_postgresql_plan(child, depth + 1)
+
+
+def _explain_postgresql(connection: Connection, statement: str, parameters):
+    (plan,) = connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + statement, parameters
+    ).scalar()
+    lines, full_scans = [], []
+    for node, depth in _walk_postgresql_plan(plan["Plan"]):
+        relation = node.get("Relation Name")
+        lines.append(
+            "  " * depth + node["Node Type"] + (" on " + relation if relation else "")
+        )
+        if node["Node Type"] == "Seq Scan":
+            full_scans.append(relation)
+    return lines, full_scans
+
+
+def _explain_mysql(connection: Connection, statement: str, parameters):
+    rows = connection.exec_driver_sql("EXPLAIN " + statement, parameters).mappings()
+    lines, full_scans = [], []
+    for row in rows:
+        lines.append("%s: type=%s key=%s" % (row["table"], row["type"], row["key"]))
+        if row["type"] == "ALL":
+            full_scans.append(row["table"])
+    return lines, full_scans
+
+
+EXPLAINERS = {
+    "sqlite": _explain_sqlite,
+    "postgresql": _explain_postgresql,
+    "mysql": _explain_mysql,
+    "mariadb": _explain_mysql,
+}
+
+
+def is_explainable(statement: str) -> bool:
+    return statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS)
+
+
+def get_indexed_columns(table: Table) -> set:
+    """Names of columns which are the leading column of an index."""
+    leading_columns = set()
+    for index in table.indexes:
+        leading_columns.add(index.columns[0].name)
+    # foreign key and check constraints do not create indexes
+    for constraint in table.constraints:
+        if isinstance(constraint, (PrimaryKeyConstraint, UniqueConstraint)):
+            if constraint.columns:
+                leading_columns.add(list(constraint.columns)[0].name)
+    return leading_columns
+
+
+def find_missing_indexes(table: Table, statement: str) -> List[str]:
+    """Columns filtered or sorted on by statement which lack an index."""
+    match = re.search(r"\bWHERE\b(.*)", statement, re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return []
+    conditions = match.group(1)
+    indexed_columns = get_indexed_columns(table)
+    return [
+        column.name
+        for column in table.columns
+        if column.name not in indexed_columns
+        and re.search(
+            r'(?:\b%s\.)?"?\b%s\b"?\s*(?:=|<|>|!=|\bIN\b|\bLIKE\b|\bIS\b|\bBETWEEN\b)'
+            % (re.escape(table.name), re.escape(column.name)),
+            conditions,
+            re.IGNORECASE,
+        )
+    ]
+
+
+def explain(
+    connection: Connection, metadata: MetaData, statement: str, parameters
+) -> QueryPlan:
+    explainer = EXPLAINERS.get(connection.dialect.name)
+    if explainer is None:
+        raise DatabaseException(
+            "EXPLAIN is not supported for dialect: %s" % connection.dialect.name
+        )
+    if isinstance(parameters, list):
+        parameters = tuple(parameters)
+    lines, full_scans = explainer(connection, statement, parameters)
+    plan = QueryPlan(statement=statement, lines=lines, full_scans=full_scans)
+    for table_name in full_scans:
+        table = metadata.tables.get(table_name)
+        if table is not None:
+            columns = find_missing_indexes(table, statement)
+            if columns:
+                plan.missing_indexes[table_name] = columns
+    return plan
+
+
+def render_index_revision(missing_indexes: Dict[str, Sequence[str]]) -> str:
+    """Render upgrade/downgrade functions of an Alembic revision."""
+    upgrade, downgrade = [], []
+    for table_name, columns in sorted(missing_indexes.items()):
+        for column in sorted(columns):
+            index_name = "ix_%s_%s" % (table_name, column)
+            upgrade.append(
+                "    op.create_index(op.f(%r), %r, [%r], unique=False)"
+                % (index_name, table_name, column)
+            )
+            downgrade.insert(
+                0,
+                "    op.drop_index(op.f(%r), table_name=%r)" % (index_name, table_name),
+            )
+    return "\n".join(
+        [
+            "def upgrade() -> None:",
+            *upgrade,
+            "",
+            "",
+            "def downgrade() -> None:",
+            *downgrade,
+        ]
+    )
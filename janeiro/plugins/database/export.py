@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Iterable, List, Sequence, Type
+
+from sqlalchemy import select
+from starlette.responses import StreamingResponse
+
+from janeiro.plugins.database.entity import Entity
+from janeiro.plugins.database.session import engines
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def serialize_value(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def format_ndjson(keys: List[str], rows: Iterable[Sequence[Any]]) -> str:
+    return "".join(
+        json.dumps(dict(zip(keys, row)), default=serialize_value) + "\n" for row in rows
+    )
+
+
+def format_csv(keys: List[str], rows: Iterable[Sequence[Any]]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if keys is not None:
+        writer.writerow(keys)
+    writer.writerows([serialize_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _format_partition(format: ExportFormat, keys, rows, header: bool) -> str:
+    if format is ExportFormat.CSV:
+        return format_csv(keys if header else None, rows)
+    return format_ndjson(keys, rows)
+
+
+def get_export_statement(entity: Type[Entity], columns: Sequence[str] = None):
+    table = entity.__table__
+    if columns is None:
+        return select(*table.columns)
+    return select(*[table.columns[name] for name in columns])
+
+
+def iter_export(entity: Type[Entity], format: ExportFormat, batch_size: int, columns):
+    """Yield serialized batches of rows streamed from a server-side cursor."""
+    statement = get_export_statement(entity, columns)
+    with engines.get_read_engine().connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(statement)
+        keys = list(result.keys())
+        for index, rows in enumerate(result.partitions()):
+            yield _format_partition(format, keys, rows, header=index == 0)
+
+
+async def aiter_export(
+    entity: Type[Entity], format: ExportFormat, batch_size: int, columns
+):
+    """Same as iter_export, for database running in async mode."""
+    statement = get_export_statement(entity, columns)
+    async with engines.get_read_engine().connect() as connection:
+        result = await connection.stream(
+            statement.execution_options(yield_per=batch_size)
+        )
+        keys = list(result.keys())
+        index = 0
+        async for rows in result.partitions():
+            yield _format_partition(format, keys, rows, header=index == 0)
+            index += 1
+
+
+def export_response(
+    entity: Type[Entity],
+    format: ExportFormat = ExportFormat.NDJSON,
+    batch_size: int = 1000,
+    columns: Sequence[str] = None,
+) -> StreamingResponse:
+    """Stream every row of entity table, with memory bounded by batch_size."""
+    format = ExportFormat(format)
+    if engines.is_async:
+        content = aiter_export(entity, format, batch_size, columns)
+    else:
+        content = iter_export(entity, format, batch_size, columns)
+    filename = "%s.%s" % (entity.__tablename__, format.value)
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": 'attachment; filename="%s"' % filename},
+    )
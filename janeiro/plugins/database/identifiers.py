@@ -0,0 +1,64 @@
+import os
+import time
+from uuid import UUID, uuid4
+
+from sqlalchemy import BINARY, Uuid
+from sqlalchemy.types import TypeDecorator
+
+# dialects storing UUID in a native 16 bytes column type
+NATIVE_UUID_DIALECTS = ("postgresql", "mssql")
+
+
+def uuid7() -> UUID:
+    """Generate a UUIDv7, starting with a millisecond timestamp (RFC 9562).
+
+    Successive values are roughly ordered, which keeps inserts in a B-tree
+    index next to each other instead of scattered across its pages.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    random_bits = int.from_bytes(os.urandom(10), "big")
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= (random_bits >> 62 & 0xFFF) << 64
+    value |= 0b10 << 62  # variant
+    value |= random_bits & 0x3FFF_FFFF_FFFF_FFFF
+    return UUID(int=value)
+
+
+def new_uuid4() -> str:
+    return uuid4().hex
+
+
+def new_uuid7() -> str:
+    return uuid7().hex
+
+
+class BinaryUUID(TypeDecorator):
+    """UUID handled as an hex string, but stored on 16 bytes.
+
+    Native UUID type is used when dialect has one, BINARY(16) otherwise.
+    """
+
+    impl = BINARY(16)
+    cache_ok = True
+    # values are handled as hex strings, whatever the column type
+    python_type = str
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name in NATIVE_UUID_DIALECTS:
+            return dialect.type_descriptor(Uuid(as_uuid=True))
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, UUID):
+            value = UUID(hex=value)
+        return value if dialect.name in NATIVE_UUID_DIALECTS else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, UUID):
+            value = UUID(bytes=bytes(value))
+        return value.hex
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from logging import Logger
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from janeiro.plugins.database.export import serialize_value
+from janeiro.plugins.logging import REQUEST_ID_CTX, add_access_log_fields
+from janeiro.plugins.tracing import record_span
+
+QUERY_STATISTICS_CTX = ContextVar("QUERY_STATISTICS", default=None)
+
+# connection info key of cursor execution start times
+QUERY_START_KEY = "janeiro.instrumentation.query_start"
+
+# parameters of other statements may hold written values, such as passwords
+REPLAYABLE_STATEMENTS = ("SELECT",)
+
+
+class QueryStatistics:
+    def __init__(self):
+        self.request_id = None
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, duration: float):
+        if self.request_id is None:
+            # request ID is set by logging middleware, which may run inside
+            self.request_id = REQUEST_ID_CTX.get("")
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def get_server_timing(self) -> str:
+        return 'db;dur=%.2f;desc="%s queries"' % (self.duration * 1000, self.count)
+
+    def get_access_log_fields(self) -> dict:
+        return {"db_queries": self.count, "db_ms": round(self.duration * 1000, 2)}
+
+
+class SlowQueryLog:
+    """Keep track of the slowest statements, with parameters to replay reads."""
+
+    def __init__(self, max_size: int = 100):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.statements = {}
+
+    def record(self, statement: str, parameters, duration: float):
+        with self.lock:
+            entry = self.statements.get(statement)
+            if entry is None:
+                if len(self.statements) >= self.max_size:
+                    fastest = min(
+                        self.statements, key=lambda key: self.statements[key]["max"]
+                    )
+                    if self.statements[fastest]["max"] >= duration:
+                        return
+                    del self.statements[fastest]
+                entry = {"count": 0, "total": 0.0, "max": 0.0, "parameters": None}
+                self.statements[statement] = entry
+            entry["count"] += 1
+            entry["total"] += duration
+            if duration >= entry["max"]:
+                entry["max"] = duration
+                if is_replayable(statement):
+                    entry["parameters"] = parameters
+
+    def as_list(self) -> list:
+        with self.lock:
+            entries = sorted(
+                self.statements.items(), key=lambda item: item[1]["max"], reverse=True
+            )
+            return [
+                {
+                    "statement": statement,
+                    "parameters": serialize_parameters(entry["parameters"]),
+                    "count": entry["count"],
+                    "total_ms": entry["total"] * 1000,
+                    "max_ms": entry["max"] * 1000,
+                }
+                for statement, entry in entries
+            ]
+
+
+def is_replayable(statement: str) -> bool:
+    return statement.lstrip().upper().startswith(REPLAYABLE_STATEMENTS)
+
+
+def serialize_parameters(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: serialize_value(value) for key, value in parameters.items()}
+    return [serialize_value(value) for value in parameters]
+
+
+class QueryInstrumentation:
+    def __init__(
+        self,
+        logger: Logger,
+        slow_query_threshold: float,
+        n_plus_one_threshold: int,
+    ):
+        self.logger = logger
+        self.slow_query_threshold = slow_query_threshold
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_queries = SlowQueryLog()
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault(QUERY_START_KEY, []).append(time.perf_counter_ns())
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        start = conn.info[QUERY_START_KEY].pop()
+        self.record(statement, parameters, executemany, start)
+
+    def handle_error(self, exception_context):
+        # statements failing in cursor execution never reach after_cursor_execute
+        conn = exception_context.connection
+        starts = conn.info.get(QUERY_START_KEY) if conn is not None else None
+        if not starts or exception_context.statement is None:
+            return
+        executemany = getattr(exception_context.execution_context, "executemany", False)
+        self.record(
+            exception_context.statement,
+            exception_context.parameters,
+            executemany,
+            starts.pop(),
+            error=type(exception_context.original_exception).__name__,
+        )
+
+    def record(self, statement, parameters, executemany, start: int, **attributes):
+        end = time.perf_counter_ns()
+        duration = (end - start) / 1e9
+        name = "db " + statement.lstrip().split(None, 1)[0]
+        record_span(name, start, end, **attributes)
+        statistics = QUERY_STATISTICS_CTX.get()
+        if statistics is not None:
+            statistics.record(statement, duration)
+        if duration >= self.slow_query_threshold:
+            self.logger.warning("Slow query (%.1fms): %s", duration * 1000, statement)
+            # statements run with many parameter sets can not be replayed
+            if not executemany:
+                self.slow_queries.record(statement, parameters, duration)
+
+    def listen(self, engine: Engine):
+        engine = getattr(engine, "sync_engine", engine)
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def report(self, statistics: QueryStatistics):
+        """Log statements repeated enough in a request to be an N+1 pattern."""
+        for statement, count in statistics.statements.items():
+            if count >= self.n_plus_one_threshold:
+                self.logger.warning(
+                    "Possible N+1 query in request %s, statement run %s times: %s",
+                    statistics.request_id,
+                    count,
+                    statement,
+                )
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, app: ASGIApp, instrumentation: QueryInstrumentation):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        statistics = QueryStatistics()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", statistics.get_server_timing())
+            await send(message)
+
+        # read by logging middleware, whether it runs inside or outside
+        add_access_log_fields(scope, statistics.get_access_log_fields)
+        token = QUERY_STATISTICS_CTX.set(statistics)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            QUERY_STATISTICS_CTX.reset(token)
+        self.instrumentation.report(statistics)
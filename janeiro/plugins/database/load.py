@@ -0,0 +1,199 @@
+import csv
+import io
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, List, Type
+
+from sqlalchemy import Column, Connection, Engine, Table, insert
+
+from janeiro.plugins.database.entity import Entity, iter_chunks
+from janeiro.plugins.database.exc import DatabaseException
+from janeiro.plugins.database.export import ExportFormat
+
+# pragmas trading durability for speed while loading a SQLite database
+SQLITE_LOAD_PRAGMAS = {"journal_mode": "WAL", "synchronous": "OFF"}
+
+# marker of NULL values in rows sent to PostgreSQL COPY
+COPY_NULL = "\\N"
+
+
+def get_entity(name: str) -> Type[Entity]:
+    """Find entity class by table or class name."""
+    for mapper in Entity.registry.mappers:
+        if name in (mapper.local_table.name, mapper.class_.__name__):
+            return mapper.class_
+    raise DatabaseException("No entity found for table: %s" % name)
+
+
+def get_format(path: str, format: str = None) -> ExportFormat:
+    if format is None:
+        format = path.rsplit(".", 1)[-1].lower()
+    try:
+        return ExportFormat(format)
+    except ValueError:
+        raise DatabaseException(
+            "Unknown format of file %s, expected one of: %s"
+            % (path, ", ".join(item.value for item in ExportFormat))
+        )
+
+
+def read_rows(file: io.TextIOBase, format: ExportFormat) -> Iterator[tuple]:
+    """Yield rows along with the number of the line they end on."""
+    if format is ExportFormat.CSV:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                yield line_number, json.loads(line)
+
+
+def coerce_value(column: Column, value):
+    """Convert a value read from a text file to the column python type."""
+    if not isinstance(value, str):
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    # types such as TypeDecorator may not tell which values they accept
+    if python_type in (str, object):
+        return value
+    if value == "":
+        return None
+    if python_type is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    if python_type in (datetime, date):
+        return python_type.fromisoformat(value)
+    if python_type is bytes:
+        return bytes.fromhex(value)
+    return python_type(value)
+
+
+def coerce_rows(table: Table, rows: Iterable[tuple]) -> Iterator[dict]:
+    for line_number, row in rows:
+        unknown_keys = row.keys() - table.columns.keys()
+        if unknown_keys:
+            raise DatabaseException(
+                "Unknown columns for table %s on line %s: %s"
+                % (table.name, line_number, ", ".join(sorted(unknown_keys)))
+            )
+        try:
+            yield {
+                key: coerce_value(table.columns[key], value)
+                for key, value in row.items()
+            }
+        except (TypeError, ValueError) as error:
+            raise DatabaseException(
+                "Invalid value for table %s on line %s: %s"
+                % (table.name, line_number, error)
+            )
+
+
+@contextmanager
+def sqlite_load_pragmas(connection: Connection):
+    previous_values = {
+        pragma: connection.exec_driver_sql("PRAGMA %s" % pragma).scalar()
+        for pragma in SQLITE_LOAD_PRAGMAS
+    }
+    for pragma, value in SQLITE_LOAD_PRAGMAS.items():
+        connection.exec_driver_sql("PRAGMA %s = %s" % (pragma, value))
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.rollback()
+        for pragma, value in previous_values.items():
+            connection.exec_driver_sql("PRAGMA %s = %s" % (pragma, value))
+        connection.commit()
+
+
+def _copy_value(value):
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def get_missing_defaults(table: Table, rows: List[dict]) -> dict:
+    """Python-side defaults of columns missing from rows, unknown to COPY."""
+    return {
+        column.key: column.default
+        for column in table.columns
+        if column.default is not None and any(column.key not in row for row in rows)
+    }
+
+
+def can_copy_rows(table: Table, rows: List[dict]) -> bool:
+    # callable, SQL expression and sequence defaults are only run by inserts
+    defaults = get_missing_defaults(table, rows).values()
+    return all(default.is_scalar for default in defaults)
+
+
+def copy_rows(connection: Connection, table: Table, rows: List[dict]):
+    """Send rows to PostgreSQL through COPY, which skips statement parsing."""
+    defaults = {
+        key: default.arg for key, default in get_missing_defaults(table, rows).items()
+    }
+    rows = [{**defaults, **row} for row in rows]
+    keys = list(table.columns.keys())
+    keys = [key for key in keys if any(key in row for row in rows)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_copy_value(row.get(key)) for key in keys] for row in rows)
+    buffer.seek(0)
+    statement = "COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '%s')" % (
+        table.name,
+        ", ".join('"%s"' % key for key in keys),
+        COPY_NULL,
+    )
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            cursor.copy_expert(statement, buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def load_rows(
+    engine: Engine,
+    entity: Type[Entity],
+    rows: Iterable[dict],
+    chunk_size: int = None,
+    on_progress: Callable[[int, float], None] = None,
+) -> int:
+    """Insert rows by chunks, each in its own transaction.
+
+    Only one chunk is held in memory at a time, on_progress is called after
+    each chunk with the number of rows loaded so far and elapsed seconds.
+    """
+    table = entity.__table__
+    count = 0
+    start_time = time.perf_counter()
+    with engine.connect() as connection:
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            pragmas = sqlite_load_pragmas(connection)
+        else:
+            pragmas = nullcontext()
+        with pragmas:
+            for chunk in iter_chunks(rows, chunk_size or entity.__chunk_size__):
+                chunk = entity._prepare_create_rows(chunk)
+                with connection.begin():
+                    if dialect == "postgresql" and can_copy_rows(table, chunk):
+                        copy_rows(connection, table, chunk)
+                    else:
+                        connection.execute(insert(table), chunk)
+                count += len(chunk)
+                if on_progress is not None:
+                    on_progress(count, time.perf_counter() - start_time)
+    return count
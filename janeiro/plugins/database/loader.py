@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any, Dict, Hashable, List, Type
+
+from janeiro.plugins.database.exc import EntityNotFound
+from janeiro.plugins.database.session import get_unit_of_work, run_async
+
+
+class EntityLoader:
+    """Coalesce lookups of entities by a unique attribute into IN queries.
+
+    Keys requested during the same event loop iteration are fetched by a
+    single query, and each key is fetched at most once per loader.
+    """
+
+    def __init__(self, entity: Type, attr: str, lock: asyncio.Lock):
+        self.entity = entity
+        self.attr = attr
+        self.lock = lock
+        self.futures: Dict[Hashable, asyncio.Future] = {}
+        self.pending_keys: List[Hashable] = []
+        self.tasks = set()
+
+    def load(self, key: Hashable) -> "asyncio.Future[Any]":
+        future = self.futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[key] = loop.create_future()
+            if not self.pending_keys:
+                # let every task ready to run in this iteration add its keys
+                loop.call_soon(self._schedule_dispatch)
+            self.pending_keys.append(key)
+        return future
+
+    def _schedule_dispatch(self):
+        # keep a reference on dispatch task until it is done
+        task = asyncio.get_running_loop().create_task(self._dispatch())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self):
+        keys, self.pending_keys = self.pending_keys, []
+        try:
+            # session can not be used concurrently by several loaders
+            async with self.lock:
+                entities = await run_async(self.entity._get_many_by, self.attr, keys)
+        except Exception as error:
+            for key in keys:
+                self.futures.pop(key).set_exception(error)
+            return
+
+        for key in keys:
+            entity = entities.get(key)
+            if entity is None:
+                self.futures[key].set_exception(
+                    EntityNotFound(
+                        f"{self.entity.__name__} with {self.attr}={key} not found."
+                    )
+                )
+            else:
+                self.futures[key].set_result(entity)
+
+
+def get_loader(entity: Type, attr: str) -> EntityLoader:
+    """Return the loader of the current unit of work, or a one-off loader."""
+    unit = get_unit_of_work()
+    if unit is None:
+        return EntityLoader(entity, attr, asyncio.Lock())
+    loader = unit.loaders.get((entity, attr))
+    if loader is None:
+        loader = unit.loaders[(entity, attr)] = EntityLoader(
+            entity, attr, unit.loaders_lock
+        )
+    return loader
@@ -0,0 +1,26 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from janeiro.plugins.database.session import async_commit, async_unit_of_work
+
+
+class UnitOfWorkMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async with async_unit_of_work() as unit:
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    # settle changes before client gets a response about them,
+                    # anything done while streaming body is committed on exit
+                    if message["status"] >= 400:
+                        unit.discard()
+                    else:
+                        await async_commit()
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
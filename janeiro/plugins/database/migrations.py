@@ -0,0 +1,211 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy import Connection, Engine
+
+from janeiro.plugins.database.exc import DatabaseException
+
+logger = logging.getLogger(__name__)
+
+# statements taking and releasing a lock held by a connection, by dialect
+MIGRATION_LOCK_STATEMENTS = {
+    "postgresql": (
+        "SELECT pg_advisory_lock(hashtext('janeiro_migrations'))",
+        "SELECT pg_advisory_unlock(hashtext('janeiro_migrations'))",
+    ),
+    "mysql": (
+        "SELECT GET_LOCK('janeiro_migrations', -1)",
+        "SELECT RELEASE_LOCK('janeiro_migrations')",
+    ),
+}
+MIGRATION_LOCK_STATEMENTS["mariadb"] = MIGRATION_LOCK_STATEMENTS["mysql"]
+
+# progress of data migrations, so that an interrupted upgrade resumes them
+checkpoint_table = sa.Table(
+    "janeiro_data_migrations",
+    sa.MetaData(),
+    sa.Column("name", sa.String(255), primary_key=True),
+    sa.Column("last_key", sa.Text, nullable=True),
+    sa.Column("rows", sa.Integer, nullable=False, default=0),
+    sa.Column("completed_at", sa.DateTime, nullable=True),
+)
+
+
+def postgresql_replication_lag(connection: Connection) -> float:
+    """Replay lag in seconds of the most late replica streaming from primary."""
+    return connection.exec_driver_sql(
+        "SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0) "
+        "FROM pg_stat_replication"
+    ).scalar()
+
+
+class Throttle:
+    def __init__(
+        self,
+        max_rows_per_second: float = None,
+        lag_probe: Callable[[Connection], float] = None,
+        max_lag: float = 1.0,
+        lag_poll_interval: float = 1.0,
+    ):
+        self.max_rows_per_second = max_rows_per_second
+        self.lag_probe = lag_probe
+        self.max_lag = max_lag
+        self.lag_poll_interval = lag_poll_interval
+
+    def wait(self, connection: Connection, rows: int, elapsed: float):
+        """Sleep after a chunk of rows took elapsed seconds to migrate."""
+        if self.max_rows_per_second:
+            delay = rows / self.max_rows_per_second - elapsed
+            if delay > 0:
+                time.sleep(delay)
+        if self.lag_probe is not None:
+            lag = self.get_lag(connection)
+            while lag > self.max_lag:
+                logger.info("Replication lag is %.1fs, waiting", lag)
+                time.sleep(self.lag_poll_interval)
+                lag = self.get_lag(connection)
+
+    def get_lag(self, connection: Connection) -> float:
+        with connection.begin():
+            return self.lag_probe(connection)
+
+
+def _load_checkpoint(connection: Connection, name: str):
+    return connection.execute(
+        sa.select(checkpoint_table).where(checkpoint_table.c.name == name)
+    ).first()
+
+
+def _save_checkpoint(connection: Connection, name: str, last_key, rows: int):
+    values = {"last_key": json.dumps(last_key), "rows": rows}
+    if last_key is None:
+        values["completed_at"] = datetime.utcnow()
+    result = connection.execute(
+        sa.update(checkpoint_table)
+        .where(checkpoint_table.c.name == name)
+        .values(values)
+    )
+    if result.rowcount == 0:
+        connection.execute(sa.insert(checkpoint_table).values(name=name, **values))
+
+
+def run_data_migration(
+    name: str,
+    table: str,
+    migrate: Callable[[Connection, List], None],
+    *,
+    key: str = "id",
+    chunk_size: int = 1000,
+    throttle: Throttle = None,
+):
+    """Call migrate with chunks of keys of table rows, ordered by key.
+
+    Meant to be called from the upgrade function of a revision. Each chunk is
+    committed along with a checkpoint, so an interrupted upgrade resumes after
+    the last migrated chunk instead of starting over. Key must be unique and
+    indexed, and statements of the revision preceding the call idempotent.
+    """
+    context = op.get_context()
+    if context.as_sql:
+        raise DatabaseException("Data migrations can not run in offline mode")
+    throttle = throttle or Throttle()
+    key_column = sa.column(key)
+    statement = (
+        sa.select(key_column)
+        .select_from(sa.table(table))
+        .order_by(key_column)
+        .limit(chunk_size)
+    )
+    # commit pending schema changes and migrate data in separate transactions
+    with context.autocommit_block():
+        with context.bind.engine.connect() as connection:
+            with connection.begin():
+                checkpoint_table.create(connection, checkfirst=True)
+                checkpoint = _load_checkpoint(connection, name)
+            if checkpoint is not None and checkpoint.completed_at is not None:
+                logger.info("Data migration %s already completed", name)
+                return
+            last_key, rows = None, 0
+            if checkpoint is not None:
+                last_key, rows = json.loads(checkpoint.last_key), checkpoint.rows
+                logger.info("Resuming data migration %s after %s", name, last_key)
+
+            while True:
+                start_time = time.perf_counter()
+                with connection.begin():
+                    chunk_statement = statement
+                    if last_key is not None:
+                        chunk_statement = statement.where(key_column > last_key)
+                    keys = connection.execute(chunk_statement).scalars().all()
+                    if keys:
+                        migrate(connection, keys)
+                        last_key, rows = keys[-1], rows + len(keys)
+                    _save_checkpoint(connection, name, last_key if keys else None, rows)
+                if not keys:
+                    break
+                elapsed = time.perf_counter() - start_time
+                logger.info(
+                    "Data migration %s: %s rows (%.0f rows/s)",
+                    name,
+                    rows,
+                    len(keys) / elapsed,
+                )
+                throttle.wait(connection, len(keys), elapsed)
+    logger.info("Data migration %s completed: %s rows", name, rows)
+
+
+def reset_data_migration(name: str):
+    """Forget progress of data migration, to be called on downgrade."""
+    context = op.get_context()
+    if context.as_sql or sa.inspect(context.bind).has_table(checkpoint_table.name):
+        op.execute(checkpoint_table.delete().where(checkpoint_table.c.name == name))
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Hold a lock on the database, so that processes upgrade it one at a time.
+
+    SQLite databases are locked through a file next to them, as a locking
+    transaction would also block the connection running migrations.
+    """
+    if engine.dialect.name == "sqlite":
+        database = engine.url.database
+        if not database or database == ":memory:":
+            # in memory databases are not shared between processes
+            yield
+            return
+        try:
+            # file locks are only available on Unix
+            import fcntl
+        except ImportError:
+            logger.warning("SQLite database migrations are not locked on Windows")
+            yield
+            return
+        with open(database + ".migration-lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    statements = MIGRATION_LOCK_STATEMENTS.get(engine.dialect.name)
+    if statements is None:
+        logger.warning("Database migrations are not locked on %s", engine.dialect.name)
+        yield
+        return
+    lock_statement, unlock_statement = statements
+    with engine.connect() as connection:
+        connection.exec_driver_sql(lock_statement)
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql(unlock_statement)
+            connection.commit()
@@ -0,0 +1,49 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import Column, tuple_
+
+from janeiro.plugins.database.exc import InvalidCursor
+
+
+@dataclass
+class Page:
+    items: List[Any]
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    raw_cursor = json.dumps(values, separators=(",", ":")).encode()
+    return urlsafe_b64encode(raw_cursor).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[Column]) -> List[Any]:
+    try:
+        raw_cursor = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw_cursor)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match pagination keys")
+        return [
+            (
+                datetime.fromisoformat(value)
+                if column.type.python_type is datetime
+                else value
+            )
+            for column, value in zip(columns, values)
+        ]
+    except (binascii.Error, TypeError, ValueError) as error:
+        raise InvalidCursor(f"Invalid pagination cursor: {cursor}") from error
+
+
+def after_cursor(columns: Sequence[Column], values: Sequence[Any]):
+    """Criterion matching rows located after cursor values in columns order."""
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    return tuple_(*columns) > tuple_(*values)
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import AsyncExitStack, ExitStack
+from typing import Callable, Sequence
+
+import sqlalchemy.exc
+from sqlalchemy import Engine, event, make_url
+from sqlalchemy.pool import NullPool, Pool, QueuePool
+
+# upper bounds (in milliseconds) of checkout latency histogram buckets
+CHECKOUT_LATENCY_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolStatistics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_out = 0
+        self.checkouts = 0
+        self.connections = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.latency_histogram = [0] * (len(CHECKOUT_LATENCY_BUCKETS) + 1)
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        bucket = bisect_left(CHECKOUT_LATENCY_BUCKETS, seconds * 1000)
+        with self.lock:
+            self.latency_histogram[bucket] += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.connections += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.checked_out -= 1
+
+    def listen(self, engine: Engine):
+        event.listen(engine, "connect", self.on_connect)
+        event.listen(engine, "checkout", self.on_checkout)
+        event.listen(engine, "checkin", self.on_checkin)
+
+    def as_dict(self, pool: Pool) -> dict:
+        bounds = [str(bound) for bound in CHECKOUT_LATENCY_BUCKETS] + ["+Inf"]
+        with self.lock:
+            return {
+                "pool": type(pool).__name__,
+                "status": pool.status(),
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "connections": self.connections,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "checkout_latency_ms": dict(zip(bounds, self.latency_histogram)),
+            }
+
+
+def get_pool(engine) -> Pool:
+    return getattr(engine, "sync_engine", engine).pool
+
+
+def get_instrumented_pool_class(database_url: str, statistics: PoolStatistics):
+    """Subclass the dialect's default pool to time every connection checkout."""
+    url = make_url(database_url)
+    pool_class = url.get_dialect().get_pool_class(url)
+
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except sqlalchemy.exc.TimeoutError:
+                statistics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            statistics.record_wait(time.perf_counter() - start)
+            return connection
+
+    InstrumentedPool.__name__ = pool_class.__name__
+    return InstrumentedPool
+
+
+def create_instrumented_engine(
+    create: Callable, database_url: str, statistics: PoolStatistics, **options
+):
+    pool_class = get_instrumented_pool_class(database_url, statistics)
+    # only forward options which were set, as some pools reject sizing options
+    options = {key: value for key, value in options.items() if value is not None}
+    engine = create(database_url, poolclass=pool_class, **options)
+    statistics.listen(getattr(engine, "sync_engine", engine))
+    return engine
+
+
+def get_warm_up_size(engine, size: int) -> int:
+    """Number of connections which remain pooled once released."""
+    pool = get_pool(engine)
+    if isinstance(pool, NullPool):
+        return 0
+    if isinstance(pool, QueuePool):
+        # overflow connections are closed when released
+        return min(size, pool.size())
+    return min(size, 1)
+
+
+def warm_up(engines: Sequence[Engine], size: int) -> int:
+    """Open connections up front, so first requests skip connection setup."""
+    count = 0
+    with ExitStack() as stack:
+        for engine in engines:
+            for _ in range(get_warm_up_size(engine, size)):
+                stack.enter_context(engine.connect())
+                count += 1
+    return count
+
+
+async def async_warm_up(engines: Sequence, size: int) -> int:
+    async with AsyncExitStack() as stack:
+        connections = [
+            stack.enter_async_context(engine.connect())
+            for engine in engines
+            for _ in range(get_warm_up_size(engine, size))
+        ]
+        await asyncio.gather(*connections)
+    return len(connections)
@@ -0,0 +1,68 @@
+from typing import List, Optional, Sequence, Type
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, create_model
+
+from janeiro.plugins.database.entity import Entity
+from janeiro.plugins.database.exc import InvalidCursor
+from janeiro.plugins.database.export import ExportFormat, export_response
+from janeiro.plugins.database.session import run_async
+
+
+def add_list_route(
+    router: APIRouter,
+    entity: Type[Entity],
+    response_model: Type[BaseModel],
+    *,
+    path: str = None,
+    default_limit: int = 50,
+    max_limit: int = 500,
+    **route_options,
+):
+    """Register a keyset paginated GET route listing entities on router."""
+    page_model = create_model(
+        response_model.__name__ + "Page",
+        items=(List[response_model], ...),
+        next_cursor=(Optional[str], None),
+    )
+
+    async def endpoint_list_entities(
+        limit: int = Query(default_limit, ge=1, le=max_limit),
+        cursor: str = Query(None, description="Cursor of the page to fetch"),
+    ):
+        try:
+            return await run_async(entity._paginate, limit, cursor)
+        except InvalidCursor as error:
+            raise HTTPException(status_code=400, detail=str(error))
+
+    router.add_api_route(
+        path or "/" + entity.__tablename__,
+        endpoint_list_entities,
+        methods=["GET"],
+        response_model=page_model,
+        **route_options,
+    )
+
+
+def add_export_route(
+    router: APIRouter,
+    entity: Type[Entity],
+    *,
+    path: str = None,
+    batch_size: int = 1000,
+    columns: Sequence[str] = None,
+    **route_options,
+):
+    """Register a GET route streaming all entities as NDJSON or CSV on router."""
+
+    async def endpoint_export_entities(
+        format: ExportFormat = Query(ExportFormat.NDJSON),
+    ):
+        return export_response(entity, format, batch_size=batch_size, columns=columns)
+
+    router.add_api_route(
+        path or "/" + entity.__tablename__ + "/export",
+        endpoint_export_entities,
+        methods=["GET"],
+        **route_options,
+    )
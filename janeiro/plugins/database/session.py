@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import threading
+from asyncio import current_task
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, List, Union
+
+from sqlalchemy import Engine, Select, event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_scoped_session, async_sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from janeiro.plugins.database.pool import get_pool
+
+
+class UnitOfWork:
+    def __init__(self):
+        self.discarded = False
+        # entity loaders memoizing lookups made during the unit of work
+        self.loaders = {}
+        self.loaders_lock = asyncio.Lock()
+
+    def discard(self):
+        """Roll back changes instead of committing them when unit of work ends."""
+        self.discarded = True
+
+
+UNIT_OF_WORK_CTX = ContextVar("UNIT_OF_WORK", default=None)
+
+
+def _get_session_scope():
+    unit = UNIT_OF_WORK_CTX.get()
+    return threading.get_ident() if unit is None else unit
+
+
+def _get_async_session_scope():
+    unit = UNIT_OF_WORK_CTX.get()
+    return current_task() if unit is None else unit
+
+
+REPLICA_STRATEGIES = ("round_robin", "least_connections")
+
+
+def _count_checked_out(engine: Union[Engine, AsyncEngine]) -> int:
+    pool = get_pool(engine)
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+class EngineRegistry:
+    engine: Engine
+    async_engine: AsyncEngine
+    replicas: List[Union[Engine, AsyncEngine]]
+
+    def __init__(self):
+        self.engine = None
+        self.async_engine = None
+        self.replicas = []
+        self.replica_strategy = "round_robin"
+        self.replica_counter = itertools.count()
+
+    @property
+    def is_async(self) -> bool:
+        return self.async_engine is not None
+
+    def get_read_engine(self) -> Union[Engine, AsyncEngine]:
+        """Select a replica engine, or primary engine when there is none."""
+        if not self.replicas:
+            return self.async_engine if self.is_async else self.engine
+        if self.replica_strategy == "least_connections":
+            return min(self.replicas, key=_count_checked_out)
+        return self.replicas[next(self.replica_counter) % len(self.replicas)]
+
+
+engines = EngineRegistry()
+
+# session info keys used to route statements between primary and replicas
+PINNED_TO_PRIMARY_KEY = "janeiro.routing.pinned_to_primary"
+READ_ENGINE_KEY = "janeiro.routing.read_engine"
+
+
+class RoutingSession(Session):
+    """Session sending reads to a replica until it writes.
+
+    Once it wrote anything, the session sticks to the primary until its
+    transaction ends so that it can read its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not engines.replicas or self.info.get(PINNED_TO_PRIMARY_KEY):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+
+        is_read = (
+            isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+        )
+        if not is_read:
+            self.info[PINNED_TO_PRIMARY_KEY] = True
+            return super().get_bind(mapper, clause=clause, **kwargs)
+
+        # a single replica is used per transaction to get a consistent view
+        read_engine = self.info.get(READ_ENGINE_KEY)
+        if read_engine is None:
+            read_engine = engines.get_read_engine()
+            read_engine = getattr(read_engine, "sync_engine", read_engine)
+            self.info[READ_ENGINE_KEY] = read_engine
+        return read_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+@event.listens_for(RoutingSession, "after_rollback")
+def _reset_routing(session: RoutingSession):
+    session.info.pop(PINNED_TO_PRIMARY_KEY, None)
+    session.info.pop(READ_ENGINE_KEY, None)
+
+
+# sessions are shared by everything running in the same unit of work, which
+# is propagated to tasks and threadpools along with context variables
+session = scoped_session(
+    session_factory=sessionmaker(class_=RoutingSession),
+    scopefunc=_get_session_scope,
+)
+
+# attributes must stay readable once the session is committed, as lazy loading
+# them would require a round-trip which is not allowed outside of an await
+async_session = async_scoped_session(
+    session_factory=async_sessionmaker(
+        expire_on_commit=False, sync_session_class=RoutingSession
+    ),
+    scopefunc=_get_async_session_scope,
+)
+
+
+def bind_engines(
+    engine: Engine,
+    async_engine: AsyncEngine = None,
+    replicas: List[Union[Engine, AsyncEngine]] = (),
+    replica_strategy: str = "round_robin",
+):
+    engines.engine = engine
+    engines.async_engine = async_engine
+    engines.replicas = list(replicas)
+    engines.replica_strategy = replica_strategy
+    session.session_factory.configure(bind=engine)
+    if async_engine is not None:
+        async_session.session_factory.configure(bind=async_engine)
+
+
+def run_in_session(function: Callable[..., Any], *args, **kwargs):
+    """Call function with the current session as first argument.
+
+    When database runs in async mode, function is run against the session
+    wrapped by current AsyncSession and an awaitable is returned instead.
+    """
+    if engines.is_async:
+        return async_session().run_sync(function, *args, **kwargs)
+    return function(session(), *args, **kwargs)
+
+
+async def run_async(function: Callable[..., Any], *args, **kwargs):
+    """Same as run_in_session, using a threadpool to not block in sync mode."""
+    if engines.is_async:
+        return await async_session().run_sync(function, *args, **kwargs)
+    return await run_in_threadpool(function, session(), *args, **kwargs)
+
+
+def get_unit_of_work() -> UnitOfWork:
+    return UNIT_OF_WORK_CTX.get()
+
+
+def autocommit(session: Session):
+    """Commit session unless its changes are committed by a unit of work."""
+    if UNIT_OF_WORK_CTX.get() is None:
+        session.commit()
+
+
+@contextmanager
+def unit_of_work():
+    """Share one session in the block, committed once when block exits."""
+    unit = UnitOfWork()
+    token = UNIT_OF_WORK_CTX.set(unit)
+    try:
+        yield unit
+        if session.registry.has() and not unit.discarded:
+            session.commit()
+    finally:
+        # closing the session rolls back anything left uncommitted
+        session.remove()
+        UNIT_OF_WORK_CTX.reset(token)
+
+
+async def async_commit():
+    """Commit sessions opened in the current unit of work."""
+    if async_session.registry.has():
+        await async_session.commit()
+    if session.registry.has():
+        await run_in_threadpool(session.commit)
+
+
+@asynccontextmanager
+async def async_unit_of_work():
+    """Same as unit_of_work, without blocking the event loop in sync mode."""
+    unit = UnitOfWork()
+    token = UNIT_OF_WORK_CTX.set(unit)
+    try:
+        yield unit
+        if not unit.discarded:
+            await async_commit()
+    finally:
+        if async_session.registry.has():
+            await async_session.remove()
+        if session.registry.has():
+            await run_in_threadpool(session.remove)
+        UNIT_OF_WORK_CTX.reset(token)
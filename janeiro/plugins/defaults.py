@@ -1,12 +1,13 @@
+import json
+import logging
 import sys
 import urllib.error
 import urllib.request
 from datetime import datetime
 
 import click
-import uvicorn
-from pydantic import BaseModel
 
+from janeiro.imports import import_from_string
 from janeiro.plugins import Plugin
 
 API_COMMAND_GROUP = "api"
@@ -26,6 +27,9 @@ class ApiPlugin(Plugin):
         self.asgi_factory = asgi_factory
 
     def cmd_start_api(self, host: str, port: int, debug: bool, workers: int):
+        # imported by the only command using it, to keep other ones fast
+        import uvicorn
+
         uvicorn.run(
             self.asgi_factory,
             host=host,
@@ -37,9 +41,132 @@ class ApiPlugin(Plugin):
             workers=workers,
         )
 
+    def cmd_bench_api(
+        self,
+        path: tuple,
+        requests: int,
+        concurrency: int,
+        warmup: int,
+        header: tuple,
+        output: str,
+        baseline: str,
+        tolerance: float,
+    ):
+        import asyncio
+
+        from janeiro.benchmark import (
+            compare_results,
+            get_benchmark_routes,
+            run_benchmark,
+        )
+
+        api = import_from_string(self.asgi_factory)()
+        # measure request handling, not console output of debug logs
+        logging.getLogger().setLevel(logging.WARNING)
+        paths = list(path) or get_benchmark_routes(api)
+        headers = [
+            tuple(part.strip() for part in value.split(":", 1)) for value in header
+        ]
+        results = asyncio.run(
+            run_benchmark(api, paths, requests, concurrency, warmup, headers)
+        )
+
+        click.echo(
+            "%-40s %10s %10s %10s %10s %8s"
+            % ("route", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors")
+        )
+        for route, result in results.items():
+            click.echo(
+                "%-40s %10s %10s %10s %10s %8s"
+                % (
+                    route,
+                    result["requests_per_second"],
+                    result["p50_ms"],
+                    result["p95_ms"],
+                    result["p99_ms"],
+                    result["errors"],
+                )
+            )
+
+        if output is not None:
+            with open(output, "w") as output_file:
+                json.dump(results, output_file, indent=2)
+            click.echo("Results written to %s" % output)
+
+        if baseline is not None:
+            with open(baseline) as baseline_file:
+                regressions = compare_results(
+                    results, json.load(baseline_file), tolerance
+                )
+            for regression in regressions:
+                click.echo("Regression! " + regression, file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+
     def extend_cli(self, cli):
         cli.declare_group(group=API_COMMAND_GROUP, description="Commands to manage API")
 
+        cli.add_command(
+            self.cmd_bench_api,
+            name="bench",
+            help="Benchmark API routes in process, without starting a server.",
+            group=API_COMMAND_GROUP,
+            options=[
+                click.option(
+                    "-p",
+                    "--path",
+                    multiple=True,
+                    help="Path to benchmark with GET requests. Defaults to every "
+                    "GET route without path parameters.",
+                ),
+                click.option(
+                    "-n",
+                    "--requests",
+                    type=click.IntRange(min=1),
+                    default=1000,
+                    help="Number of requests sent to each route.",
+                ),
+                click.option(
+                    "-c",
+                    "--concurrency",
+                    type=click.IntRange(min=1),
+                    default=10,
+                    help="Number of requests in flight at the same time.",
+                ),
+                click.option(
+                    "--warmup",
+                    type=click.IntRange(min=0),
+                    default=50,
+                    help="Number of requests sent to each route before measuring.",
+                ),
+                click.option(
+                    "-H",
+                    "--header",
+                    multiple=True,
+                    help="Header sent with requests, formatted as 'Name: value'.",
+                ),
+                click.option(
+                    "-o",
+                    "--output",
+                    default=None,
+                    help="Path of JSON file to save results to, as a baseline.",
+                ),
+                click.option(
+                    "-b",
+                    "--baseline",
+                    default=None,
+                    help="Path of JSON baseline to compare results with. "
+                    "Fails with exit code 1 on regression.",
+                ),
+                click.option(
+                    "--tolerance",
+                    type=float,
+                    default=0.1,
+                    help="Ratio by which p95 or throughput may degrade.",
+                ),
+            ],
+        )
+
         cli.add_command(
             self.cmd_start_api,
             name="start",
@@ -63,11 +190,6 @@ class ApiPlugin(Plugin):
 START_DATE = datetime.utcnow()
 
 
-class HealthCheckDTO(BaseModel):
-    version: str
-    uptime_seconds: float
-
-
 class HealthCheckPlugin(Plugin):
     __plugin__ = "healthcheck"
 
@@ -96,10 +218,11 @@ class HealthCheckPlugin(Plugin):
 
     def endpoint_healthcheck(self):
         current_date = datetime.utcnow()
-        return HealthCheckDTO(
-            version=self.api_version,
-            uptime_seconds=(current_date - START_DATE).total_seconds(),
-        )
+        # validated against HealthCheckDTO, declared as response model
+        return {
+            "version": self.api_version,
+            "uptime_seconds": (current_date - START_DATE).total_seconds(),
+        }
 
     def extend_cli(self, cli):
         cli.declare_group(group=API_COMMAND_GROUP, description="Commands to manage API")
@@ -113,6 +236,9 @@ class HealthCheckPlugin(Plugin):
         )
 
     def extend_api(self, api):
+        # pydantic is only imported along with the API
+        from janeiro.schemas import HealthCheckDTO
+
         api.add_api_route(
             "/healthcheck", self.endpoint_healthcheck, response_model=HealthCheckDTO
         )
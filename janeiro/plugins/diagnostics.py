@@ -0,0 +1,339 @@
+import itertools
+import json
+import os
+import sys
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, List
+
+import click
+
+from janeiro.config import ConfigOption
+from janeiro.exc import JaneiroException
+from janeiro.plugins import Plugin
+from janeiro.plugins.defaults import PORT_CMD_OPTION
+from janeiro.security import is_valid_token
+
+DIAGNOSTICS_COMMAND_GROUP = "diagnostics"
+
+# diagnostics routes are not registered unless a token is configured
+DIAGNOSTICS_TOKEN_OPTION = ConfigOption(key="diagnostics.token", type=str, default=None)
+
+TOKEN_HEADER = "X-Diagnostics-Token"
+
+# oldest snapshots are discarded past this number
+MAX_SNAPSHOTS = 10
+
+# allocations made by tracing itself
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class TracingNotStarted(JaneiroException): ...
+
+
+class SnapshotNotFound(JaneiroException): ...
+
+
+def get_module_names() -> Dict[str, str]:
+    """Name of loaded modules by file path."""
+    module_names = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, "__file__", None)
+        if filename is not None:
+            module_names.setdefault(filename, name)
+    return module_names
+
+
+def get_group(filename: str, module_names: Dict[str, str], depth: int) -> str:
+    name = module_names.get(filename)
+    if name is None:
+        return filename
+    if depth:
+        return ".".join(name.split(".")[:depth])
+    return name
+
+
+def group_statistics(statistics, depth: int, limit: int) -> List[dict]:
+    """Sum statistics of files by module, or by package up to depth."""
+    module_names = get_module_names()
+    groups = {}
+    for statistic in statistics:
+        group = get_group(statistic.traceback[0].filename, module_names, depth)
+        totals = groups.setdefault(
+            group,
+            {"module": group, "size_kb": 0.0, "count": 0},
+        )
+        totals["size_kb"] += statistic.size / 1024
+        totals["count"] += statistic.count
+        if hasattr(statistic, "size_diff"):
+            totals.setdefault("size_diff_kb", 0.0)
+            totals.setdefault("count_diff", 0)
+            totals["size_diff_kb"] += statistic.size_diff / 1024
+            totals["count_diff"] += statistic.count_diff
+    sort_key = (
+        "size_diff_kb"
+        if statistics and hasattr(statistics[0], "size_diff")
+        else "size_kb"
+    )
+    groups = sorted(
+        groups.values(), key=lambda totals: abs(totals[sort_key]), reverse=True
+    )
+    return groups[:limit]
+
+
+class MemoryDiagnostics:
+    """Tracemalloc snapshots of the current worker process.
+
+    Snapshot ids are prefixed with the process id, as API workers each trace
+    their own allocations and requests may be served by any of them.
+    """
+
+    def __init__(self, max_snapshots: int = MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()
+        self.snapshot_ids = itertools.count(1)
+
+    def start(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise TracingNotStarted(
+                "Tracemalloc is not started in worker %s" % os.getpid()
+            )
+        return tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+
+    def save_snapshot(self) -> str:
+        snapshot = self.take_snapshot()
+        snapshot_id = "%s-%s" % (os.getpid(), next(self.snapshot_ids))
+        self.snapshots[snapshot_id] = snapshot
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get_snapshot(self, snapshot_id: str) -> tracemalloc.Snapshot:
+        pid = snapshot_id.partition("-")[0]
+        if pid != str(os.getpid()):
+            raise SnapshotNotFound(
+                "Snapshot %s was taken by worker %s, not by worker %s: "
+                "memory diagnostics require a single API worker"
+                % (snapshot_id, pid, os.getpid())
+            )
+        snapshot = self.snapshots.get(snapshot_id)
+        if snapshot is None:
+            raise SnapshotNotFound("Snapshot %s not found" % snapshot_id)
+        return snapshot
+
+    def top(self, limit: int, depth: int, since: str = None) -> List[dict]:
+        snapshot = self.take_snapshot()
+        if since is None:
+            statistics = snapshot.statistics("filename")
+        else:
+            statistics = snapshot.compare_to(self.get_snapshot(since), "filename")
+        return group_statistics(statistics, depth, limit)
+
+
+class DiagnosticsPlugin(Plugin):
+    __plugin__ = "diagnostics"
+
+    def __init__(self, memory_path: str = "/diagnostics/memory"):
+        super().__init__()
+        self.memory_path = memory_path
+        self.memory = MemoryDiagnostics()
+
+    def configure(self, config):
+        self.token = config.get(DIAGNOSTICS_TOKEN_OPTION)
+
+    def endpoint_memory_status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "pid": os.getpid(),
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_kb": current / 1024,
+            "peak_kb": peak / 1024,
+            "overhead_kb": tracemalloc.get_tracemalloc_memory() / 1024,
+            "snapshots": list(self.memory.snapshots),
+        }
+
+    def endpoint_memory_start(self, frames: int = 1):
+        self.memory.start(frames)
+        return self.endpoint_memory_status()
+
+    def endpoint_memory_stop(self):
+        self.memory.stop()
+        return self.endpoint_memory_status()
+
+    def endpoint_memory_snapshot(self):
+        from fastapi import HTTPException
+
+        try:
+            snapshot_id = self.memory.save_snapshot()
+        except TracingNotStarted as error:
+            raise HTTPException(status_code=409, detail=str(error))
+        return {"pid": os.getpid(), "snapshot": snapshot_id}
+
+    def endpoint_memory_top(self, limit: int = 20, depth: int = 0, since: str = None):
+        from fastapi import HTTPException
+
+        try:
+            modules = self.memory.top(limit, depth, since)
+        except TracingNotStarted as error:
+            raise HTTPException(status_code=409, detail=str(error))
+        except SnapshotNotFound as error:
+            raise HTTPException(status_code=404, detail=str(error))
+        return {"pid": os.getpid(), "modules": modules}
+
+    def _call_api(self, port: int, method: str, path: str, **params):
+        params = {key: value for key, value in params.items() if value is not None}
+        url = "http://127.0.0.1:%s%s%s?%s" % (
+            port,
+            self.memory_path,
+            path,
+            urllib.parse.urlencode(params),
+        )
+        request = urllib.request.Request(
+            url, method=method, headers={TOKEN_HEADER: self.token or ""}
+        )
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as error:
+            click.echo(
+                "Request to %s failed: %s" % (url, error.read().decode()),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        except urllib.error.URLError as error:
+            click.echo("Request to %s failed: %s" % (url, error), file=sys.stderr)
+            sys.exit(1)
+        return json.load(response)
+
+    def cmd_memory_start(self, port: int, frames: int):
+        click.echo(json.dumps(self._call_api(port, "POST", "/start", frames=frames)))
+
+    def cmd_memory_stop(self, port: int):
+        click.echo(json.dumps(self._call_api(port, "POST", "/stop")))
+
+    def cmd_memory_snapshot(self, port: int):
+        result = self._call_api(port, "POST", "/snapshots")
+        click.echo(
+            "Snapshot %s taken in worker %s" % (result["snapshot"], result["pid"])
+        )
+
+    def cmd_memory_top(self, port: int, limit: int, depth: int, since: str):
+        result = self._call_api(
+            port, "GET", "/top", limit=limit, depth=depth, since=since
+        )
+        click.echo("Worker %s" % result["pid"])
+        for totals in result["modules"]:
+            if since is None:
+                click.echo(
+                    "%12.1f KiB %10d  %s"
+                    % (totals["size_kb"], totals["count"], totals["module"])
+                )
+            else:
+                click.echo(
+                    "%+12.1f KiB %+10d  %s"
+                    % (totals["size_diff_kb"], totals["count_diff"], totals["module"])
+                )
+
+    def extend_api(self, api):
+        if self.token is None:
+            return
+        # fastapi is only imported along with the API
+        from fastapi import Depends, Header, HTTPException
+
+        def check_token(x_diagnostics_token: str = Header(None)):
+            if not is_valid_token(x_diagnostics_token, self.token):
+                raise HTTPException(status_code=403, detail="Invalid diagnostics token")
+
+        for path, endpoint, method in (
+            ("", self.endpoint_memory_status, "GET"),
+            ("/start", self.endpoint_memory_start, "POST"),
+            ("/stop", self.endpoint_memory_stop, "POST"),
+            ("/snapshots", self.endpoint_memory_snapshot, "POST"),
+            ("/top", self.endpoint_memory_top, "GET"),
+        ):
+            api.add_api_route(
+                self.memory_path + path,
+                endpoint,
+                methods=[method],
+                dependencies=[Depends(check_token)],
+            )
+
+    def extend_cli(self, cli):
+        # each worker traces its own memory, so API must run a single worker
+        cli.declare_group(
+            DIAGNOSTICS_COMMAND_GROUP,
+            description="Commands to diagnose a running API, started with one worker",
+        )
+
+        cli.add_command(
+            self.cmd_memory_start,
+            name="memory-start",
+            help="Start tracing memory allocations of an API worker.",
+            group=DIAGNOSTICS_COMMAND_GROUP,
+            options=[
+                PORT_CMD_OPTION,
+                click.option(
+                    "--frames",
+                    type=int,
+                    default=1,
+                    help="Number of frames stored per allocation traceback.",
+                ),
+            ],
+        )
+
+        cli.add_command(
+            self.cmd_memory_stop,
+            name="memory-stop",
+            help="Stop tracing memory allocations and discard snapshots.",
+            group=DIAGNOSTICS_COMMAND_GROUP,
+            options=[PORT_CMD_OPTION],
+        )
+
+        cli.add_command(
+            self.cmd_memory_snapshot,
+            name="memory-snapshot",
+            help="Take a snapshot of traced allocations, to diff later ones with.",
+            group=DIAGNOSTICS_COMMAND_GROUP,
+            options=[PORT_CMD_OPTION],
+        )
+
+        cli.add_command(
+            self.cmd_memory_top,
+            name="memory-top",
+            help="Show modules holding most traced memory, or growing most since a snapshot.",
+            group=DIAGNOSTICS_COMMAND_GROUP,
+            options=[
+                PORT_CMD_OPTION,
+                click.option("-n", "--limit", type=int, default=20),
+                click.option(
+                    "-d",
+                    "--depth",
+                    type=int,
+                    default=0,
+                    help="Group modules by package up to depth. Zero means modules.",
+                ),
+                click.option(
+                    "-s",
+                    "--since",
+                    type=str,
+                    default=None,
+                    help="Identifier of a snapshot to diff current allocations with.",
+                ),
+            ],
+        )
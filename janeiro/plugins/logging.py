@@ -1,14 +1,62 @@
+import logging
+import re
+import time
+import zlib
 from contextvars import ContextVar
 from logging import Logger, getLogRecordFactory, setLogRecordFactory
+from typing import Callable, Dict, List
 from uuid import uuid4
 
-from fastapi import Header, Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from janeiro.config import ConfigOption
+from janeiro.exc import ConfigurationError
+from janeiro.logging import JsonFormatter, QueueLogging
 from janeiro.plugins import Plugin
 
 REQUEST_ID_CTX = ContextVar("REQUEST_ID")
 
+# scope key under which request ID is kept, once read or generated
+REQUEST_ID_SCOPE_KEY = "janeiro.request_id"
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# scope key of functions returning extra access log fields of the request,
+# added by middlewares and called once it ends
+ACCESS_LOG_FIELDS_SCOPE_KEY = "janeiro.access_log_fields"
+
+LOGGING_JSON_OPTION = ConfigOption(key="logging.json", type=bool, default=False)
+
+# share of successful requests logged, unless slow or routed to another rate
+LOGGING_ACCESS_SAMPLE_RATE_OPTION = ConfigOption(
+    key="logging.access.sample_rate", type=float, default=1.0
+)
+
+# list of "<route path>=<rate>" overriding sample rate of some routes
+LOGGING_ACCESS_ROUTE_SAMPLE_RATES_OPTION = ConfigOption(
+    key="logging.access.route_sample_rates", type=list, default_factory=list
+)
+
+LOGGING_ACCESS_SLOW_MS_OPTION = ConfigOption(
+    key="logging.access.slow_ms", type=float, default=1000.0
+)
+
+# responses with this status or above are always logged, whatever sample rate
+LOGGING_ACCESS_ALWAYS_STATUS_OPTION = ConfigOption(
+    key="logging.access.always_status", type=int, default=400
+)
+
+LOGGING_QUEUE_ENABLED_OPTION = ConfigOption(
+    key="logging.queue.enabled", type=bool, default=False
+)
+
+# records logged while queue is full are dropped and counted
+LOGGING_QUEUE_SIZE_OPTION = ConfigOption(
+    key="logging.queue.size", type=int, default=10000
+)
+
 old_factory = getLogRecordFactory()
 
 
@@ -27,39 +75,170 @@ def record_factory(*args, **kwargs):
 setLogRecordFactory(record_factory)
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, logger: Logger, dispatch=None):
-        super().__init__(app, dispatch)
+def parse_traceparent(traceparent: str):
+    """Return trace ID and parent span ID of a W3C traceparent header."""
+    match = TRACEPARENT_PATTERN.match(traceparent or "")
+    if match is None or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def get_request_id(scope: Scope) -> str:
+    """ID from X-Request-ID or traceparent headers, generated when missing."""
+    request_id = scope.get(REQUEST_ID_SCOPE_KEY)
+    if request_id is None:
+        # raw headers are scanned, which is cheaper than parsing all of them
+        header_request_id = traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id" and header_request_id is None:
+                header_request_id = value.decode("latin-1")
+            elif name == b"traceparent" and traceparent is None:
+                traceparent = value.decode("latin-1")
+        request_id = header_request_id
+        if request_id is None or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = parse_traceparent(traceparent)[0]
+        if request_id is None:
+            request_id = uuid4().hex
+        scope[REQUEST_ID_SCOPE_KEY] = request_id
+    return request_id
+
+
+def add_access_log_fields(scope: Scope, get_fields: Callable[[], dict]):
+    """Add fields to access log of request, read once it ends."""
+    scope.setdefault(ACCESS_LOG_FIELDS_SCOPE_KEY, []).append(get_fields)
+
+
+def get_route_path(scope: Scope) -> str:
+    """Path template of the route matched by request, if any."""
+    # recent FastAPI versions include routers lazily, leaving their prefix
+    # out of route path, full path is then kept on effective route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    return getattr(scope.get("route"), "path", None)
+
+
+def parse_route_sample_rates(entries: List[str]) -> Dict[str, float]:
+    route_sample_rates = {}
+    for entry in entries:
+        route, _, rate = entry.rpartition("=")
+        try:
+            route_sample_rates[route.strip()] = float(rate)
+        except ValueError:
+            raise ConfigurationError("Invalid route sample rate: %s" % entry)
+    return route_sample_rates
+
+
+class AccessLogSampler:
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        route_sample_rates: Dict[str, float] = None,
+        slow_threshold: float = 1.0,
+        always_status: int = 400,
+    ):
+        self.sample_rate = sample_rate
+        self.route_sample_rates = route_sample_rates or {}
+        self.slow_threshold = slow_threshold
+        self.always_status = always_status
+
+    def is_sampled(self, request_id: str, route: str) -> bool:
+        rate = self.route_sample_rates.get(route, self.sample_rate)
+        # derived from request ID, so that every log of a request agrees on it
+        return zlib.crc32(request_id.encode()) < rate * 0x100000000
+
+    def should_log(
+        self, request_id: str, route: str, status_code: int, duration: float
+    ) -> bool:
+        """Errors and slow requests are always logged."""
+        if status_code >= self.always_status or duration >= self.slow_threshold:
+            return True
+        return self.is_sampled(request_id, route)
+
+
+class LoggingMiddleware:
+    def __init__(self, app: ASGIApp, logger: Logger, sampler: AccessLogSampler = None):
+        self.app = app
         self.logger = logger
+        self.sampler = sampler or AccessLogSampler()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # unhandled errors are turned into 500 responses by an outer middleware
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-    async def dispatch(self, request: Request, call_next):
-        request_id = uuid4().hex
+        request_id = get_request_id(scope)
         token = REQUEST_ID_CTX.set(request_id)
-        response = await call_next(request)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start_time
+            route = get_route_path(scope)
+            if self.logger.isEnabledFor(logging.INFO) and self.sampler.should_log(
+                request_id, route, status_code, duration
+            ):
+                self.log_access(scope, route, status_code, duration)
+            REQUEST_ID_CTX.reset(token)
+
+    def log_access(self, scope: Scope, route: str, status_code: int, duration: float):
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+        }
+        for get_fields in scope.get(ACCESS_LOG_FIELDS_SCOPE_KEY, ()):
+            fields.update(get_fields())
         self.logger.info(
             "%s %s  %s",
-            request.method,
-            request.url.path,
-            response.status_code,
+            scope["method"],
+            scope["path"],
+            status_code,
+            extra={"fields": fields},
         )
-        REQUEST_ID_CTX.reset(token)
-        return response
 
 
 class LoggingPlugin(Plugin):
     __plugin__ = "logging"
 
-    async def dependency_logging(
-        self,
-        request: Request,
-        x_request_id: str = Header(None, description="Request ID"),
-    ):
-        self.logger.debug(
-            "%s %s  ...",
-            request.method,
-            request.url.path,
+    def configure(self, config):
+        if config.get(LOGGING_JSON_OPTION):
+            for handler in logging.getLogger().handlers:
+                handler.setFormatter(JsonFormatter())
+        self.sampler = AccessLogSampler(
+            sample_rate=config.get(LOGGING_ACCESS_SAMPLE_RATE_OPTION),
+            route_sample_rates=parse_route_sample_rates(
+                config.get(LOGGING_ACCESS_ROUTE_SAMPLE_RATES_OPTION)
+            ),
+            slow_threshold=config.get(LOGGING_ACCESS_SLOW_MS_OPTION) / 1000,
+            always_status=config.get(LOGGING_ACCESS_ALWAYS_STATUS_OPTION),
         )
+        self.queue_logging = None
+        if config.get(LOGGING_QUEUE_ENABLED_OPTION):
+            self.queue_logging = QueueLogging(config.get(LOGGING_QUEUE_SIZE_OPTION))
+
+    def startup(self):
+        # only API logs through queue, as commands exit without cleanup
+        if self.queue_logging is not None:
+            self.queue_logging.start()
+
+    def cleanup(self):
+        if self.queue_logging is not None:
+            self.queue_logging.stop()
 
     def extend_api(self, api):
-        api.add_dependency(self.dependency_logging)
-        api.add_middleware(LoggingMiddleware, logger=self.logger)
+        api.add_middleware(
+            LoggingMiddleware,
+            logger=self.logger.getChild("access"),
+            sampler=self.sampler,
+        )
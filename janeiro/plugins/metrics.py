@@ -0,0 +1,340 @@
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from janeiro.config import ConfigOption
+from janeiro.exc import ConfigurationError
+from janeiro.plugins import Plugin
+from janeiro.plugins.logging import get_route_path
+
+# upper bounds (in seconds) of request duration histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+# directory shared by worker processes, each one writing its own file, which
+# defaults to a temporary directory named after their parent process: set it
+# when workers are not forked by a single server process, e.g. by a process
+# manager, or they would not see each other's metrics
+METRICS_DIRECTORY_OPTION = ConfigOption(key="metrics.directory", type=str, default=None)
+
+# requests of routes past this number are counted under a single route
+METRICS_MAX_ROUTES_OPTION = ConfigOption(
+    key="metrics.max_routes", type=int, default=256
+)
+
+# counters of exited workers, merged so that totals never go backwards
+ARCHIVE_FILENAME = "archive.json"
+LOCK_FILENAME = "metrics.lock"
+
+UNMATCHED_ROUTE = "<unmatched>"
+# key of the last slot, shared by routes once every other slot is used
+OTHER_ROUTES_KEY = "ANY <other>"
+
+# file layout, as float64 values: a header holding number of requests in
+# flight, followed by one slot per route holding its key and its values
+HEADER_SIZE = 1
+KEY_SIZE = 32
+VALUES_SIZE = len(STATUS_CLASSES) + len(LATENCY_BUCKETS) + 2
+SLOT_SIZE = KEY_SIZE + VALUES_SIZE
+BUCKETS_OFFSET = len(STATUS_CLASSES)
+SUM_OFFSET = BUCKETS_OFFSET + len(LATENCY_BUCKETS) + 1
+
+
+def get_default_directory(app_name: str) -> str:
+    # uvicorn workers share their parent process, which tells deployments apart,
+    # while a single process server gets the directory of the shell running it
+    return os.path.join(
+        tempfile.gettempdir(), "%s-metrics-%s" % (app_name, os.getppid())
+    )
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def iter_slots(values: memoryview, max_routes: int) -> Iterator[Tuple[str, int]]:
+    """Yield key and values offset of each used route slot."""
+    keys = values.cast("B")
+    for index in range(max_routes):
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        key = bytes(keys[offset * 8 : (offset + KEY_SIZE) * 8]).rstrip(b"\0")
+        if not key:
+            break
+        yield key.decode(), offset + KEY_SIZE
+
+
+def add_values(routes: Dict[str, List[float]], values: memoryview, max_routes: int):
+    for key, offset in iter_slots(values, max_routes):
+        totals = routes.setdefault(key, [0.0] * VALUES_SIZE)
+        for index in range(VALUES_SIZE):
+            totals[index] += values[offset + index]
+
+
+@contextmanager
+def lock_directory(directory: str, exclusive: bool = False):
+    """Lock metrics directory, to read files while none is being archived."""
+    # only available on Unix, checked once plugin is configured
+    import fcntl
+
+    with open(os.path.join(directory, LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_archive(directory: str) -> Dict[str, List[float]]:
+    try:
+        with open(os.path.join(directory, ARCHIVE_FILENAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def list_dead_files(directory: str) -> List[str]:
+    paths = []
+    for filename in os.listdir(directory):
+        pid, _, extension = filename.partition(".")
+        if extension == "metrics" and not is_process_alive(int(pid)):
+            paths.append(os.path.join(directory, filename))
+    return paths
+
+
+def archive_files(directory: str, paths: List[str], max_routes: int):
+    """Merge counters of exited workers files into archive, then remove them.
+
+    Files of every exited worker are archived when paths is None, listed once
+    directory is locked so that concurrent workers never archive a file twice.
+    Requests in flight are not archived, as they were never completed.
+    """
+    with lock_directory(directory, exclusive=True):
+        if paths is None:
+            paths = list_dead_files(directory)
+        routes = read_archive(directory)
+        archived_paths = []
+        for path in paths:
+            try:
+                with open(path, "rb") as file:
+                    values = memoryview(file.read()).cast("d")
+            except FileNotFoundError:
+                # already archived by another worker
+                continue
+            add_values(routes, values, max_routes)
+            archived_paths.append(path)
+        if not archived_paths:
+            return
+        archive_path = os.path.join(directory, ARCHIVE_FILENAME)
+        with open(archive_path + ".tmp", "w") as file:
+            json.dump(routes, file)
+        os.replace(archive_path + ".tmp", archive_path)
+        for path in archived_paths:
+            os.remove(path)
+
+
+class WorkerMetrics:
+    """Metrics of the current process, kept in a memory mapped file."""
+
+    def __init__(self, directory: str, max_routes: int = 256):
+        self.directory = directory
+        self.max_routes = max_routes
+        self.path = None
+        self.file = None
+        self.mmap = None
+        self.values = None
+        self.slots: Dict[str, int] = {}
+
+    @property
+    def file_size(self) -> int:
+        return (HEADER_SIZE + self.max_routes * SLOT_SIZE) * 8
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        archive_files(self.directory, None, self.max_routes)
+        self.path = os.path.join(self.directory, "%s.metrics" % os.getpid())
+        self.file = open(self.path, "w+b")
+        self.file.truncate(self.file_size)
+        self.mmap = mmap.mmap(self.file.fileno(), self.file_size)
+        self.values = memoryview(self.mmap).cast("d")
+
+    def close(self):
+        if self.mmap is None:
+            return
+        self.values.release()
+        self.mmap.close()
+        self.file.close()
+        archive_files(self.directory, [self.path], self.max_routes)
+        self.values = self.mmap = self.file = None
+
+    def _get_slot(self, key: str) -> int:
+        offset = self.slots.get(key)
+        if offset is None:
+            if len(self.slots) >= self.max_routes - 1:
+                key = OTHER_ROUTES_KEY
+                if key in self.slots:
+                    return self.slots[key]
+            offset = HEADER_SIZE + len(self.slots) * SLOT_SIZE
+            encoded_key = key.encode()[: KEY_SIZE * 8]
+            self.mmap[offset * 8 : offset * 8 + len(encoded_key)] = encoded_key
+            self.slots[key] = offset = offset + KEY_SIZE
+        return offset
+
+    def add_in_flight(self, delta: int):
+        if self.values is not None:
+            self.values[0] += delta
+
+    def observe(self, method: str, route: str, status_code: int, duration: float):
+        if self.values is None:
+            return
+        offset = self._get_slot("%s %s" % (method, route or UNMATCHED_ROUTE))
+        values = self.values
+        values[offset + min(status_code // 100, 5) - 1] += 1
+        values[offset + BUCKETS_OFFSET + bisect_left(LATENCY_BUCKETS, duration)] += 1
+        values[offset + SUM_OFFSET] += duration
+
+
+def read_metrics(directory: str, max_routes: int):
+    """Sum metrics files of every worker process, and of exited ones."""
+    in_flight = 0
+    with lock_directory(directory):
+        routes = read_archive(directory)
+        for filename in os.listdir(directory):
+            pid, _, extension = filename.partition(".")
+            if extension != "metrics":
+                continue
+            with open(os.path.join(directory, filename), "rb") as file:
+                values = memoryview(file.read()).cast("d")
+            if not values:
+                # file of a starting worker, not sized yet
+                continue
+            # files of killed workers are only archived by the next worker
+            if is_process_alive(int(pid)):
+                in_flight += values[0]
+            add_values(routes, values, max_routes)
+    return in_flight, routes
+
+
+def format_labels(**labels) -> str:
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+def format_prometheus(in_flight: float, routes: Dict[str, List[float]]) -> str:
+    lines = [
+        "# HELP http_requests_in_flight Number of requests being processed.",
+        "# TYPE http_requests_in_flight gauge",
+        "http_requests_in_flight %d" % in_flight,
+        "# HELP http_requests_total Number of requests processed.",
+        "# TYPE http_requests_total counter",
+    ]
+    for key, values in sorted(routes.items()):
+        method, route = key.split(" ", 1)
+        for index, status in enumerate(STATUS_CLASSES):
+            if values[index]:
+                labels = format_labels(method=method, route=route, status=status)
+                lines.append("http_requests_total{%s} %d" % (labels, values[index]))
+    lines += [
+        "# HELP http_request_duration_seconds Duration of requests.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for key, values in sorted(routes.items()):
+        method, route = key.split(" ", 1)
+        labels = format_labels(method=method, route=route)
+        count = 0
+        for index, bound in enumerate(LATENCY_BUCKETS + ("+Inf",)):
+            count += values[BUCKETS_OFFSET + index]
+            lines.append(
+                'http_request_duration_seconds_bucket{%s,le="%s"} %d'
+                % (labels, bound, count)
+            )
+        lines.append(
+            "http_request_duration_seconds_sum{%s} %s" % (labels, values[SUM_OFFSET])
+        )
+        lines.append("http_request_duration_seconds_count{%s} %d" % (labels, count))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, metrics: WorkerMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # unhandled errors are turned into 500 responses by an outer middleware
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.metrics.add_in_flight(1)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start_time
+            self.metrics.add_in_flight(-1)
+            self.metrics.observe(
+                scope["method"], get_route_path(scope), status_code, duration
+            )
+
+
+class MetricsPlugin(Plugin):
+    __plugin__ = "metrics"
+
+    def __init__(self, metrics_path: str = "/metrics"):
+        super().__init__()
+        self.metrics_path = metrics_path
+
+    def configure(self, config):
+        if sys.platform == "win32":
+            raise ConfigurationError("Metrics plugin requires Unix file locks")
+        directory = config.get(METRICS_DIRECTORY_OPTION)
+        if directory is None:
+            directory = get_default_directory(config.app_name)
+        self.metrics = WorkerMetrics(directory, config.get(METRICS_MAX_ROUTES_OPTION))
+
+    def startup(self):
+        # files are only opened by API workers, not by CLI commands
+        self.metrics.open()
+
+    def cleanup(self):
+        self.metrics.close()
+
+    def endpoint_metrics(self):
+        in_flight, routes = read_metrics(
+            self.metrics.directory, self.metrics.max_routes
+        )
+        return PlainTextResponse(
+            format_prometheus(in_flight, routes),
+            media_type="text/plain; version=0.0.4",
+        )
+
+    def extend_api(self, api):
+        api.add_middleware(MetricsMiddleware, metrics=self.metrics)
+        api.add_api_route(
+            self.metrics_path, self.endpoint_metrics, include_in_schema=False
+        )
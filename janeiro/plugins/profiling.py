@@ -0,0 +1,350 @@
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from typing import Dict, Tuple
+
+import click
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from janeiro.config import ConfigOption
+from janeiro.plugins import Plugin
+from janeiro.plugins.defaults import API_COMMAND_GROUP, PORT_CMD_OPTION
+from janeiro.security import is_valid_token
+
+# profiling is disabled unless a token is configured
+PROFILING_TOKEN_OPTION = ConfigOption(key="profiling.token", type=str, default=None)
+
+PROFILING_MAX_SECONDS_OPTION = ConfigOption(
+    key="profiling.max_seconds", type=float, default=60.0
+)
+
+TOKEN_HEADER = "X-Profiling-Token"
+
+# header asking to profile a request, with the pstats sort key as value
+PROFILE_HEADER = "X-Profile"
+PROFILE_SORT_KEYS = ("cumulative", "tottime", "calls")
+PROFILE_STATS_LIMIT = 50
+
+PROFILE_FORMATS = ("speedscope", "collapsed")
+
+# only one profiler can be active at a time in a process
+PROFILER_LOCK = threading.Lock()
+
+
+def get_frame_label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return "%s (%s:%s)" % (name, code.co_filename, code.co_firstlineno)
+
+
+def get_coroutine_frames(coroutine):
+    """Frames of a suspended coroutine, from outermost to innermost await."""
+    while coroutine is not None:
+        frame = getattr(coroutine, "cr_frame", None) or getattr(
+            coroutine, "gi_frame", None
+        )
+        if frame is None:
+            return
+        yield frame
+        coroutine = getattr(coroutine, "cr_await", None) or getattr(
+            coroutine, "gi_yieldfrom", None
+        )
+
+
+class StackSampler:
+    """Sample stacks of every thread, and of tasks awaiting in event loop."""
+
+    def __init__(self, interval: float = 0.005, loop=None):
+        self.interval = interval
+        self.loop = loop
+        # number of samples by thread (or task) name and stack of frame labels
+        self.samples: Dict[Tuple[str, Tuple[str, ...]], int] = Counter()
+        self.samples_lock = threading.Lock()
+        self.task_sample_pending = False
+        self.labels = {}
+        self.duration = 0.0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="janeiro-profiler", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _get_label(self, code) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = get_frame_label(code)
+        return label
+
+    def _sample_threads(self, own_ident: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._get_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            with self.samples_lock:
+                self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+
+    def _sample_tasks(self):
+        # run in event loop thread, as its set of tasks is not thread safe
+        self.task_sample_pending = False
+        if self.stop_event.is_set():
+            return
+        for task in asyncio.all_tasks(self.loop):
+            stack = tuple(
+                self._get_label(frame.f_code)
+                for frame in get_coroutine_frames(task.get_coro())
+            )
+            if stack:
+                with self.samples_lock:
+                    self.samples[("task " + task.get_name(), stack)] += 1
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        start_time = time.perf_counter()
+        while not self.stop_event.wait(self.interval):
+            self._sample_threads(own_ident)
+            # tasks are not sampled again until loop ran previous sampling
+            if self.loop is not None and not self.task_sample_pending:
+                self.task_sample_pending = True
+                self.loop.call_soon_threadsafe(self._sample_tasks)
+        self.duration = time.perf_counter() - start_time
+
+    def to_collapsed(self) -> str:
+        """Folded stacks, as read by flamegraph.pl and speedscope."""
+        return "".join(
+            "%s;%s %s\n" % (name, ";".join(stack), count)
+            for (name, stack), count in sorted(self.samples.items())
+        )
+
+    def to_speedscope(self) -> dict:
+        frames, frame_indexes, profiles = [], {}, {}
+        for (name, stack), count in self.samples.items():
+            sample = []
+            for label in stack:
+                index = frame_indexes.get(label)
+                if index is None:
+                    index = frame_indexes[label] = len(frames)
+                    frames.append({"name": label})
+                sample.append(index)
+            profile = profiles.setdefault(
+                name,
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.duration,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append(sample)
+            profile["weights"].append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda profile: profile["name"]),
+            "exporter": "janeiro",
+        }
+
+
+class RequestProfilerMiddleware:
+    """Profile requests sent with X-Profile header, replying with their stats.
+
+    Profiler only sees the event loop thread, so code of sync endpoints, run
+    in threadpool, is accounted as time spent awaiting it. It sees everything
+    run by the event loop though, so requests served meanwhile show up in the
+    stats: profile on a worker without other traffic for accurate results.
+    Profiled requests are run one at a time, others are rejected with a 409.
+    """
+
+    def __init__(self, app: ASGIApp, token: str):
+        self.app = app
+        self.token = token
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        sort_key = headers.get(PROFILE_HEADER)
+        if sort_key is None:
+            return await self.app(scope, receive, send)
+        if not is_valid_token(headers.get(TOKEN_HEADER), self.token):
+            response = PlainTextResponse("Invalid profiling token", status_code=403)
+            return await response(scope, receive, send)
+        if not PROFILER_LOCK.acquire(blocking=False):
+            response = PlainTextResponse("Profiler already running", status_code=409)
+            return await response(scope, receive, send)
+
+        status_code = 500
+
+        async def discard(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.disable()
+        finally:
+            PROFILER_LOCK.release()
+
+        stream = io.StringIO()
+        stream.write("Response status: %s\n" % status_code)
+        stats = pstats.Stats(profiler, stream=stream)
+        if sort_key not in PROFILE_SORT_KEYS:
+            sort_key = PROFILE_SORT_KEYS[0]
+        stats.sort_stats(sort_key).print_stats(PROFILE_STATS_LIMIT)
+        await PlainTextResponse(stream.getvalue())(scope, receive, send)
+
+
+class ProfilingPlugin(Plugin):
+    __plugin__ = "profiling"
+
+    def __init__(self, profile_path: str = "/profiling/profile"):
+        super().__init__()
+        self.profile_path = profile_path
+
+    def configure(self, config):
+        self.token = config.get(PROFILING_TOKEN_OPTION)
+        self.max_seconds = config.get(PROFILING_MAX_SECONDS_OPTION)
+
+    async def profile(self, seconds: float, format: str, interval_ms: float):
+        from fastapi import HTTPException
+
+        if format not in PROFILE_FORMATS:
+            raise HTTPException(status_code=400, detail="Unknown format: %s" % format)
+        if not PROFILER_LOCK.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Profiler already running")
+        sampler = StackSampler(interval_ms / 1000, loop=asyncio.get_running_loop())
+        sampler.start()
+        try:
+            await asyncio.sleep(min(seconds, self.max_seconds))
+        finally:
+            sampler.stop()
+            PROFILER_LOCK.release()
+        if format == "collapsed":
+            return PlainTextResponse(sampler.to_collapsed())
+        return JSONResponse(sampler.to_speedscope())
+
+    def cmd_profile_api(
+        self, port: int, seconds: float, format: str, interval: float, output: str
+    ):
+        if self.token is None:
+            click.echo("Profiling is disabled, set profiling.token", file=sys.stderr)
+            sys.exit(1)
+        profile_url = "http://127.0.0.1:%s%s?seconds=%s&format=%s&interval_ms=%s" % (
+            port,
+            self.profile_path,
+            seconds,
+            format,
+            interval,
+        )
+        request = urllib.request.Request(
+            profile_url, headers={TOKEN_HEADER: self.token}
+        )
+        try:
+            response = urllib.request.urlopen(request, timeout=seconds + 30)
+        except urllib.error.URLError as error:
+            click.echo(
+                "Failed to profile API from %s: %s" % (profile_url, error),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        content = response.read().decode()
+        if output is None:
+            click.echo(content)
+            return
+        with open(output, "w") as output_file:
+            output_file.write(content)
+        if format == "speedscope":
+            profiles = json.loads(content)["profiles"]
+            click.echo(
+                "Profile of %s threads written to %s, open it with speedscope.app"
+                % (len(profiles), output)
+            )
+        else:
+            click.echo("Collapsed stacks written to %s" % output)
+
+    def extend_api(self, api):
+        if self.token is None:
+            return
+        # fastapi is only imported along with the API
+        from fastapi import Depends, Header, HTTPException, Query
+
+        def check_token(x_profiling_token: str = Header(None)):
+            if not is_valid_token(x_profiling_token, self.token):
+                raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+        async def endpoint_profile(
+            seconds: float = 5,
+            format: str = "speedscope",
+            interval_ms: float = Query(5, ge=1),
+        ):
+            return await self.profile(seconds, format, interval_ms)
+
+        api.add_middleware(RequestProfilerMiddleware, token=self.token)
+        api.add_api_route(
+            self.profile_path, endpoint_profile, dependencies=[Depends(check_token)]
+        )
+
+    def extend_cli(self, cli):
+        cli.add_command(
+            self.cmd_profile_api,
+            name="profile",
+            help="Sample stacks of a running API worker for a number of seconds.",
+            group=API_COMMAND_GROUP,
+            options=[
+                PORT_CMD_OPTION,
+                click.option(
+                    "-s",
+                    "--seconds",
+                    type=float,
+                    default=5,
+                    help="Duration of profiling.",
+                ),
+                click.option(
+                    "-f",
+                    "--format",
+                    type=click.Choice(PROFILE_FORMATS),
+                    default="speedscope",
+                    help="Speedscope JSON or collapsed stacks for flame graphs.",
+                ),
+                click.option(
+                    "-i",
+                    "--interval",
+                    type=click.FloatRange(min=1),
+                    default=5,
+                    help="Number of milliseconds between two samples.",
+                ),
+                click.option(
+                    "-o",
+                    "--output",
+                    default=None,
+                    help="Output file path. Left empty means standard output.",
+                ),
+            ],
+        )
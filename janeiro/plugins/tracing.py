@@ -0,0 +1,421 @@
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List
+
+import click
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from janeiro.config import ConfigOption
+from janeiro.plugins import Plugin
+from janeiro.plugins.defaults import PORT_CMD_OPTION
+from janeiro.plugins.logging import (
+    REQUEST_ID_CTX,
+    get_request_id,
+    get_route_path,
+    parse_traceparent,
+)
+from janeiro.security import is_valid_token
+
+TRACING_COMMAND_GROUP = "tracing"
+
+TRACE_CTX = ContextVar("TRACE", default=None)
+SPAN_CTX = ContextVar("SPAN", default=None)
+
+# number of finished traces kept in memory, oldest are evicted first
+TRACING_BUFFER_SIZE_OPTION = ConfigOption(
+    key="tracing.buffer_size", type=int, default=1000
+)
+
+# faster traces are not kept, to save buffer room for slow requests
+TRACING_MIN_DURATION_MS_OPTION = ConfigOption(
+    key="tracing.min_duration_ms", type=float, default=0.0
+)
+
+# spans opened past this number are counted but not recorded
+TRACING_MAX_SPANS_OPTION = ConfigOption(key="tracing.max_spans", type=int, default=1000)
+
+# traces endpoints are not exposed unless a token is configured, since span
+# attributes may reveal request data
+TRACING_TOKEN_OPTION = ConfigOption(key="tracing.token", type=str, default=None)
+
+TOKEN_HEADER = "X-Tracing-Token"
+
+
+def new_span_id() -> str:
+    return "%016x" % random.getrandbits(64)
+
+
+def new_trace_id() -> str:
+    return "%032x" % random.getrandbits(128)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, parent_id: str, attributes: dict, start: int = None):
+        self.name = name
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        # monotonic timestamps, in nanoseconds
+        self.start = time.perf_counter_ns() if start is None else start
+        self.end = None
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        if self.end is None:
+            return None
+        return (self.end - self.start) / 1e6
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    def __init__(
+        self, trace_id: str, request_id: str, parent_id: str, max_spans: int = 1000
+    ):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.parent_id = parent_id
+        self.max_spans = max_spans
+        self.timestamp = time.time()
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def add(self, span: Span):
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def summary(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": self.root.name,
+            "timestamp": self.timestamp,
+            "duration_ms": self.root.duration_ms,
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            **self.summary(),
+            "parent_id": self.parent_id,
+            "spans": [span.as_dict() for span in self.spans],
+        }
+
+
+class TraceBuffer:
+    """Ring buffer of finished traces."""
+
+    def __init__(self, max_size: int = 1000):
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=max_size)
+
+    def add(self, trace: Trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def list(self, min_duration_ms: float = 0, limit: int = None) -> List[Trace]:
+        """Most recent traces first."""
+        with self.lock:
+            traces = list(self.traces)
+        traces = [
+            trace
+            for trace in reversed(traces)
+            if trace.root.duration_ms >= min_duration_ms
+        ]
+        return traces[:limit]
+
+    def get(self, trace_id: str) -> Trace:
+        with self.lock:
+            for trace in self.traces:
+                if trace.trace_id == trace_id or trace.request_id == trace_id:
+                    return trace
+
+
+def to_chrome_trace(traces: List[Trace]) -> dict:
+    """Format traces for chrome://tracing or Perfetto, one thread per trace."""
+    pid = os.getpid()
+    events = []
+    for tid, trace in enumerate(traces, start=1):
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": "%s %s" % (trace.request_id, trace.root.name)},
+            }
+        )
+        for span in trace.spans:
+            if span.end is None:
+                continue
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.name.split(" ", 1)[0],
+                    "ph": "X",
+                    "ts": span.start / 1000,
+                    "dur": (span.end - span.start) / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": span.attributes,
+                }
+            )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the block as a child of the current span, if request is traced."""
+    trace = TRACE_CTX.get()
+    if trace is None:
+        yield None
+        return
+    parent = SPAN_CTX.get()
+    current = Span(name, parent and parent.span_id, attributes)
+    trace.add(current)
+    token = SPAN_CTX.set(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter_ns()
+        SPAN_CTX.reset(token)
+
+
+def record_span(name: str, start: int, end: int, **attributes):
+    """Record an already finished span, for code which can not wrap a block."""
+    trace = TRACE_CTX.get()
+    if trace is not None:
+        parent = SPAN_CTX.get()
+        current = Span(name, parent and parent.span_id, attributes, start=start)
+        current.end = end
+        trace.add(current)
+
+
+def traced(name: str = None):
+    """Decorate a function, or coroutine function, to run it in a span."""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_traceparent() -> str:
+    """W3C traceparent header propagating current span to outgoing requests."""
+    trace, current = TRACE_CTX.get(), SPAN_CTX.get()
+    if trace is None or current is None:
+        return None
+    return "00-%s-%s-01" % (trace.trace_id, current.span_id)
+
+
+class TracingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        buffer: TraceBuffer,
+        min_duration_ms: float = 0.0,
+        max_spans: int = 1000,
+    ):
+        self.app = app
+        self.buffer = buffer
+        self.min_duration_ms = min_duration_ms
+        self.max_spans = max_spans
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = get_request_id(scope)
+        trace_id, parent_id = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        trace = Trace(trace_id or new_trace_id(), request_id, parent_id, self.max_spans)
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Request-ID", request_id)
+            await send(message)
+
+        trace_token = TRACE_CTX.set(trace)
+        request_id_token = REQUEST_ID_CTX.set(request_id)
+        try:
+            with span("%s %s" % (scope["method"], scope["path"])) as root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_ID_CTX.reset(request_id_token)
+            TRACE_CTX.reset(trace_token)
+            route = get_route_path(scope)
+            if route is not None:
+                root.name = "%s %s" % (scope["method"], route)
+            root.attributes["status"] = status_code
+            if root.duration_ms >= self.min_duration_ms:
+                self.buffer.add(trace)
+
+
+class TracingPlugin(Plugin):
+    __plugin__ = "tracing"
+
+    def __init__(self, traces_path: str = "/tracing/traces"):
+        super().__init__()
+        self.traces_path = traces_path
+        self.buffer = None
+
+    def configure(self, config):
+        self.buffer = TraceBuffer(config.get(TRACING_BUFFER_SIZE_OPTION))
+        self.min_duration_ms = config.get(TRACING_MIN_DURATION_MS_OPTION)
+        self.max_spans = config.get(TRACING_MAX_SPANS_OPTION)
+        self.token = config.get(TRACING_TOKEN_OPTION)
+
+    def endpoint_list_traces(self, min_duration_ms: float = 0, limit: int = 100):
+        return [trace.summary() for trace in self.buffer.list(min_duration_ms, limit)]
+
+    def endpoint_chrome_trace(self, min_duration_ms: float = 0, limit: int = 100):
+        return to_chrome_trace(self.buffer.list(min_duration_ms, limit))
+
+    def endpoint_get_trace(self, trace_id: str):
+        from fastapi import HTTPException
+
+        trace = self.buffer.get(trace_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return trace.as_dict()
+
+    def cmd_dump_traces(self, port: int, output: str, min_duration: float, limit: int):
+        if self.token is None:
+            click.echo(
+                "Traces endpoints are disabled, set tracing.token", file=sys.stderr
+            )
+            sys.exit(1)
+        chrome_trace_url = (
+            "http://127.0.0.1:%s%s/chrome?min_duration_ms=%s&limit=%s"
+            % (
+                port,
+                self.traces_path,
+                min_duration,
+                limit,
+            )
+        )
+        request = urllib.request.Request(
+            chrome_trace_url, headers={TOKEN_HEADER: self.token}
+        )
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.URLError as error:
+            click.echo(
+                "Failed to fetch traces from %s: %s" % (chrome_trace_url, error),
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        chrome_trace = json.load(response)
+        with open(output, "w") as output_file:
+            json.dump(chrome_trace, output_file)
+        click.echo("Traces written to %s, open it with chrome://tracing" % output)
+
+    def extend_api(self, api):
+        api.add_middleware(
+            TracingMiddleware,
+            buffer=self.buffer,
+            min_duration_ms=self.min_duration_ms,
+            max_spans=self.max_spans,
+        )
+        if self.token is None:
+            return
+        # fastapi is only imported along with the API
+        from fastapi import Depends, Header, HTTPException
+
+        def check_token(x_tracing_token: str = Header(None)):
+            if not is_valid_token(x_tracing_token, self.token):
+                raise HTTPException(status_code=403, detail="Invalid tracing token")
+
+        dependencies = [Depends(check_token)]
+        api.add_api_route(
+            self.traces_path, self.endpoint_list_traces, dependencies=dependencies
+        )
+        # declared before trace route, which would match its path otherwise
+        api.add_api_route(
+            self.traces_path + "/chrome",
+            self.endpoint_chrome_trace,
+            dependencies=dependencies,
+        )
+        api.add_api_route(
+            self.traces_path + "/{trace_id}",
+            self.endpoint_get_trace,
+            dependencies=dependencies,
+        )
+
+    def extend_cli(self, cli):
+        cli.declare_group(
+            TRACING_COMMAND_GROUP, description="Commands to inspect traces"
+        )
+
+        cli.add_command(
+            self.cmd_dump_traces,
+            name="dump",
+            help="Dump traces of a running API as Chrome trace JSON.",
+            group=TRACING_COMMAND_GROUP,
+            options=[
+                PORT_CMD_OPTION,
+                click.option(
+                    "-o", "--output", default="traces.json", help="Output file path."
+                ),
+                click.option(
+                    "--min-duration",
+                    type=float,
+                    default=0,
+                    help="Only dump traces slower than this number of milliseconds.",
+                ),
+                click.option(
+                    "-n",
+                    "--limit",
+                    type=int,
+                    default=100,
+                    help="Maximum number of traces to dump, most recent first.",
+                ),
+            ],
+        )
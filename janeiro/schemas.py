@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class HealthCheckDTO(BaseModel):
+    version: str
+    uptime_seconds: float
@@ -0,0 +1,8 @@
+import hmac
+
+
+def is_valid_token(token: str, expected_token: str) -> bool:
+    """Compare tokens in constant time, never valid when either is missing."""
+    if token is None or expected_token is None:
+        return False
+    return hmac.compare_digest(token.encode(), expected_token.encode())
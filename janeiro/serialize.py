@@ -10,9 +10,16 @@ class Deserializer(ABC):
         raise NotImplementedError
 
 
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
 class DefaultDeserializer(Deserializer):
     def deserialize(self, raw_value, type):
         if isinstance(raw_value, type):
             return raw_value
+        elif type is bool:
+            return raw_value.strip().lower() in TRUE_VALUES
+        elif type is list:
+            return [item.strip() for item in raw_value.split(",") if item.strip()]
         else:
             return type(raw_value)
@@ -0,0 +1,97 @@
+import logging
+
+import httpx
+import pytest
+from fastapi import APIRouter
+from sqlalchemy import text
+
+from janeiro import Application
+from janeiro.config import Configuration
+from janeiro.config.loaders.test import TestConfigLoader as ConfigLoader
+from janeiro.plugins.database import DatabasePlugin
+from janeiro.plugins.database.session import session
+from janeiro.plugins.logging import LoggingPlugin
+
+pytestmark = pytest.mark.anyio
+
+router = APIRouter()
+
+
+@router.get("/query")
+def query():
+    session.execute(text("SELECT 1"))
+    return {}
+
+
+@router.get("/missing", status_code=404)
+def missing():
+    return {}
+
+
+def build_app(config: dict, *plugins) -> Application:
+    app = Application(
+        config=Configuration(app_name="test", loader=ConfigLoader(config)),
+        api_title="test",
+        api_version="0.0.1",
+    )
+    for plugin in plugins:
+        app.use_plugin(plugin)
+    app.include_router(router)
+    app.build_api()
+    return app
+
+
+def get_database_plugin() -> DatabasePlugin:
+    return DatabasePlugin(migrations_module="example.db.migrations")
+
+
+async def request(app: Application, path: str):
+    transport = httpx.ASGITransport(app=app.api)
+    async with app.api.router.lifespan_context(app.api):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            await client.get(path)
+
+
+def get_access_fields(caplog) -> list:
+    return [
+        record.fields for record in caplog.records if record.name.endswith(".access")
+    ]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        "database.url": "sqlite:///%s" % (tmp_path / "test.db"),
+        "database.instrumentation.enabled": "true",
+    }
+
+
+@pytest.mark.parametrize("database_first", [False, True])
+async def test_access_log_has_query_statistics(config, caplog, database_first):
+    caplog.set_level(logging.INFO)
+    plugins = [LoggingPlugin(), get_database_plugin()]
+    if database_first:
+        plugins.reverse()
+    # fields of an app are neither lost nor shared by another one
+    await request(build_app(config, *plugins), "/query")
+    await request(build_app(config, LoggingPlugin()), "/query")
+
+    with_database, without_database = get_access_fields(caplog)
+    assert with_database["db_queries"] >= 1
+    assert "db_queries" not in without_database
+
+
+async def test_client_errors_are_always_logged(caplog):
+    caplog.set_level(logging.INFO)
+    app = build_app({"logging.access.sample_rate": "0"}, LoggingPlugin())
+    await request(app, "/missing")
+    await request(app, "/query")
+
+    assert [fields["status"] for fields in get_access_fields(caplog)] == [404]
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import Column, String, create_engine, func, select
+
+from janeiro.plugins.database.cache import EntityCache
+from janeiro.plugins.database.entity import ResourceEntity
+from janeiro.plugins.database.exc import EntityNotFound
+from janeiro.plugins.database.session import bind_engines, session, unit_of_work
+
+
+class CachedEntity(ResourceEntity):
+    __tablename__ = "test_cached_entities"
+    __cache__ = EntityCache()
+
+    name = Column(String(64))
+
+
+@pytest.fixture(autouse=True)
+def engine(tmp_path):
+    engine = create_engine("sqlite:///%s" % (tmp_path / "test.db"))
+    CachedEntity.__table__.create(engine)
+    bind_engines(engine)
+    CachedEntity.__cache__.clear()
+    yield engine
+    session.remove()
+    engine.dispose()
+
+
+def count_rows(engine) -> int:
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(CachedEntity))
+
+
+def test_discarded_entity_is_not_cached(engine):
+    with unit_of_work() as unit:
+        entity = CachedEntity.create({"name": "phantom"})
+        entity_id = entity.id
+        assert CachedEntity.get_by_uuid(entity.uuid).name == "phantom"
+        unit.discard()
+
+    assert count_rows(engine) == 0
+    assert CachedEntity.__cache__.stats()["size"] == 0
+    with pytest.raises(EntityNotFound):
+        CachedEntity.get_by_id(entity_id)
+
+
+def test_committed_entity_is_cached(engine):
+    entity_id = CachedEntity.create({"name": "committed"}).id
+    session.remove()
+
+    assert CachedEntity.get_by_id(entity_id).name == "committed"
+    session.remove()
+    assert CachedEntity.get_by_id(entity_id).name == "committed"
+    assert CachedEntity.__cache__.stats()["hits"] == 1
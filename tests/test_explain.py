@@ -0,0 +1,25 @@
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+
+from janeiro.plugins.database.explain import find_missing_indexes, get_indexed_columns
+
+metadata = MetaData()
+
+parents = Table("parents", metadata, Column("id", Integer, primary_key=True))
+
+children = Table(
+    "children",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("parent_id", Integer, ForeignKey("parents.id")),
+    Column("code", String(16), unique=True),
+    Column("name", String(64), index=True),
+)
+
+
+def test_foreign_key_column_is_not_indexed():
+    assert get_indexed_columns(children) == {"id", "code", "name"}
+
+
+def test_unindexed_foreign_key_is_suggested():
+    statement = "SELECT * FROM children WHERE children.parent_id = ?"
+    assert find_missing_indexes(children, statement) == ["parent_id"]
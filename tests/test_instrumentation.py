@@ -0,0 +1,38 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from janeiro.plugins.database.instrumentation import (
+    QUERY_START_KEY,
+    QUERY_STATISTICS_CTX,
+    QueryInstrumentation,
+    QueryStatistics,
+)
+
+
+def test_failing_statement_is_recorded():
+    engine = create_engine("sqlite://")
+    instrumentation = QueryInstrumentation(
+        logging.getLogger("test"), slow_query_threshold=0, n_plus_one_threshold=5
+    )
+    instrumentation.listen(engine)
+    statistics = QueryStatistics()
+    token = QUERY_STATISTICS_CTX.set(statistics)
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing_table"))
+            connection.execute(text("SELECT 1"))
+            assert connection.info[QUERY_START_KEY] == []
+    finally:
+        QUERY_STATISTICS_CTX.reset(token)
+        engine.dispose()
+
+    assert statistics.count == 2
+    assert "SELECT * FROM missing_table" in statistics.statements
+    statements = [
+        entry["statement"] for entry in instrumentation.slow_queries.as_list()
+    ]
+    assert "SELECT * FROM missing_table" in statements